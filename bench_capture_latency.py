@@ -0,0 +1,128 @@
+import sys
+import time
+import threading
+from collections import deque
+import numpy as np
+import cv2
+from video_pipeline import LatestFrameBuffer, FramePreparer, LatencyHistogram
+from frame_sources import FrameSource, grab_latest
+
+# default read() loop against the low latency mode (grab_latest + decoding only the frames that will
+# be displayed) on a simulated camera whose driver keeps a queue of frames like V4L2/DirectShow do.
+# after a hiccup of the reader the queue is full and a reader that only keeps up never empties it,
+# every frame is shown buffers-1 frames late - unless the reader is much faster than the camera.
+# decoding (MJPEG at 1080p) is what makes it slow, decode_ms simulates it.
+# the latency here is from the exposure to the display.
+# run: python bench_capture_latency.py [seconds] [fps] [display_fps] [buffers] [decode_ms]
+
+
+class SimulatedCamera(FrameSource):
+    # frames are exposed at fps into a driver queue of `buffers` frames (the oldest is overwritten
+    # when it's full), grab() takes the oldest one, retrieve() decodes it - decode_ms on top of
+    # a YUYV conversion
+    def __init__(self, fps=30, buffers=4, width=1920, height=1080, decode_ms=12):
+        self.name = f"simulated camera {width}x{height}@{fps}, {buffers} buffers"
+        self.fps = fps
+        self.decode_seconds = decode_ms / 1000
+        self._queue = deque(maxlen=buffers)
+        self._cond = threading.Condition()
+        rng = np.random.default_rng(0)
+        self._yuyv = rng.integers(0, 255, size=(height, width, 2), dtype=np.uint8)
+        self._grabbed = None
+        self.exposure_time = None      # of the grabbed frame
+        self.running = True
+        self._thread = threading.Thread(target=self._expose, daemon=True)
+        self._thread.start()
+
+    def _expose(self):
+        next_time = time.perf_counter()
+        while self.running:
+            next_time += 1 / self.fps
+            time.sleep(max(0.0, next_time - time.perf_counter()))
+            with self._cond:
+                self._queue.append(time.perf_counter())
+                self._cond.notify()
+
+    def grab(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            self.exposure_time = self._queue.popleft()
+        return True
+
+    def retrieve(self):
+        time.sleep(self.decode_seconds)
+        return True, cv2.cvtColor(self._yuyv, cv2.COLOR_YUV2BGR_YUYV)
+
+    def read(self):
+        self.grab()
+        return self.retrieve()
+
+    def get(self, prop):
+        return self.fps if prop == cv2.CAP_PROP_FPS else 0
+
+    def release(self):
+        self.running = False
+
+
+def run(low_latency, seconds, fps, display_fps, buffers, decode_ms, hiccup_every=3.0, hiccup=0.3):
+    camera = SimulatedCamera(fps=fps, buffers=buffers, decode_ms=decode_ms)
+    preparer = FramePreparer()
+    buffer = LatestFrameBuffer(on_release=preparer.release)
+    histogram = LatencyHistogram("exposure to display")
+    display_interval = 1 / display_fps
+    exposures = {}
+    counts = {"decoded": 0, "stale": 0, "undecoded": 0}
+    running = True
+
+    def capture():
+        seq = 0
+        next_hiccup = time.perf_counter() + hiccup_every
+        while running:
+            if time.perf_counter() > next_hiccup:
+                # the reader stops for a moment - a slow prepare, a GC pause, opening the recorder...
+                time.sleep(hiccup)
+                next_hiccup += hiccup_every
+            if low_latency:
+                ret, stale = grab_latest(camera)
+                counts["stale"] += stale
+                now = time.perf_counter()
+                if not buffer.will_be_taken(now, display_interval, 1 / fps, margin=0.004 + decode_ms / 1000):
+                    counts["undecoded"] += 1
+                    continue
+                ret, frame = camera.retrieve()
+            else:
+                ret, frame = camera.read()
+            seq += 1
+            counts["decoded"] += 1
+            exposures[seq] = camera.exposure_time
+            buffer.put(preparer.prepare(frame, seq=seq, capture_time=time.perf_counter()))
+
+    thread = threading.Thread(target=capture, daemon=True)
+    thread.start()
+    time.sleep(0.5)         # settle
+    next_time = time.perf_counter()
+    end = next_time + seconds
+    while time.perf_counter() < end:
+        frame = buffer.take()
+        if frame is not None:
+            histogram.record(time.perf_counter() - exposures.pop(frame.seq))
+        next_time += display_interval
+        time.sleep(max(0.0, next_time - time.perf_counter()))
+    running = False
+    thread.join()
+    camera.release()
+
+    mode = "low latency" if low_latency else "default read()"
+    print(f"{mode}: decoded {counts['decoded']}, stale dropped {counts['stale']}, "
+          f"not decoded {counts['undecoded']}")
+    print(histogram.to_text())
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    seconds, fps, display_fps, buffers, decode_ms = (args + [10, 60, 30, 4, 12][len(args):])[:5]
+    print(f"{seconds} s, camera {fps} fps with {buffers} driver buffers, {decode_ms} ms decoding, "
+          f"display {display_fps} fps, 0.3 s reader hiccup every 3 s")
+    run(False, seconds, fps, display_fps, buffers, decode_ms)
+    run(True, seconds, fps, display_fps, buffers, decode_ms)
@@ -0,0 +1,81 @@
+import sys
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from PyQt5.QtGui import QImage
+from video_pipeline import LatestFrameBuffer, FramePreparer, rgb_to_qimage
+
+# microbenchmark for the display path: the old update_frame conversions against
+# FramePreparer with preallocated buffers and QImage over the numpy memory.
+# run: python bench_display.py [frames]
+
+DISPLAY_SHAPE = [540, 960]      # height, width
+TRACK = (960, 540, 128)         # track_x, track_y in the original frame, window size
+
+
+def make_frames(count, shape=(1080, 1920, 3)):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 255, size=shape, dtype=np.uint8) for _ in range(count)]
+
+
+def old_path(frame):
+    # what update_frame did before: new arrays for resize and cvtColor + tobytes copies
+    frame = cv2.resize(frame, (DISPLAY_SHAPE[1], DISPLAY_SHAPE[0]))
+    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    img = QImage(frame.tobytes(), frame.shape[1], frame.shape[0], frame.shape[1] * frame.shape[2],
+                 QImage.Format_RGB888)
+    x = TRACK[0] / 2
+    y = TRACK[1] / 2
+    size = TRACK[2]
+    track = frame[int(y - size / 4):int(y + 3 / 4 * size), int(x - size / 4):int(x + 3 / 4 * size)]
+    h, w, ch = track.shape
+    track_img = QImage(track.tobytes(), w, h, ch * w, QImage.Format_RGB888)
+    return img, track_img
+
+
+def make_new_path():
+    preparer = FramePreparer(display_shape=DISPLAY_SHAPE)
+    preparer.set_track_window(*TRACK)
+    buffer = LatestFrameBuffer(on_release=preparer.release)
+
+    def new_path(frame):
+        buffer.put(preparer.prepare(frame))
+        prepared = buffer.take()
+        return rgb_to_qimage(prepared.display), rgb_to_qimage(prepared.track)
+
+    return new_path
+
+
+def measure(name, func, frames, rounds):
+    # warm up - the preallocated pool and the cv2 internals
+    for frame in frames[:3]:
+        func(frame)
+
+    tracemalloc.start()
+    transient = []
+    times = []
+    for _ in range(rounds):
+        for frame in frames:
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            t = time.perf_counter()
+            result = func(frame)
+            times.append(time.perf_counter() - t)
+            _, peak = tracemalloc.get_traced_memory()
+            transient.append(peak - base)
+            del result
+    tracemalloc.stop()
+
+    times = np.array(times) * 1000
+    transient = np.array(transient) / 1024 / 1024
+    print(f"{name:<28} {np.mean(times):7.2f} ms/frame (p95 {np.percentile(times, 95):6.2f})   "
+          f"{np.mean(transient):6.2f} MB allocated/frame")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    frames = make_frames(count)
+    print(f"1080p -> {DISPLAY_SHAPE[1]}x{DISPLAY_SHAPE[0]}, {count} frames x 20 rounds")
+    measure("before (resize/tobytes)", old_path, frames, rounds=20)
+    measure("after (dst= / zero-copy)", make_new_path(), frames, rounds=20)
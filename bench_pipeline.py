@@ -0,0 +1,78 @@
+import sys
+import time
+import threading
+from video_pipeline import LatestFrameBuffer, FramePreparer, FpsCounter, LatencyStats, rgb_to_qimage
+from frame_sources import SyntheticSource
+
+# the capture -> prepare -> latest frame buffer -> render path of VideoCaptureThread and MainApp,
+# fed by SyntheticSource so it runs the same way on a machine without a camera.
+# the render side wraps the frames into QImages at the display rate like render_latest_frame,
+# without painting them. run: python bench_pipeline.py [seconds] [width] [height] [fps] [display_fps]
+# fps 0 - the source gives frames as fast as the pipeline takes them
+
+
+def run(seconds=10, width=1920, height=1080, fps=30, display_fps=30):
+    source = SyntheticSource(width=width, height=height, fps=fps or 30, realtime=bool(fps))
+    preparer = FramePreparer()
+    buffer = LatestFrameBuffer(on_release=preparer.release)
+    latency = LatencyStats()
+    capture_fps = FpsCounter()
+    display_fps_counter = FpsCounter()
+    running = True
+    captured = 0
+
+    def capture():
+        nonlocal captured
+        while running:
+            read_start = time.perf_counter()
+            ret, frame = source.read()
+            capture_time = time.perf_counter()
+            if not ret:
+                break
+            latency.record("capture", capture_time - read_start)
+            capture_fps.tick(capture_time)
+            captured += 1
+            # the track window follows the first target, like the device coordinates would
+            x, y = source.target_positions(source.frame_number - 1)[0]
+            preparer.set_track_window(x, y, 128)
+            prepared = preparer.prepare(frame, seq=captured, capture_time=capture_time)
+            latency.record("prepare", prepared.prepared_time - capture_time)
+            buffer.put(prepared)
+
+    thread = threading.Thread(target=capture, daemon=True)
+    thread.start()
+
+    interval = 1 / display_fps
+    next_time = time.perf_counter()
+    end = next_time + seconds
+    displayed = 0
+    while time.perf_counter() < end:
+        frame = buffer.take()
+        if frame is not None:
+            paint_start = time.perf_counter()
+            latency.record("queue", paint_start - frame.prepared_time)
+            images = [rgb_to_qimage(frame.display)]
+            if frame.track is not None:
+                images.append(rgb_to_qimage(frame.track))
+            paint_end = time.perf_counter()
+            latency.record("paint", paint_end - paint_start)
+            latency.record("total", paint_end - frame.capture_time)
+            display_fps_counter.tick(paint_end)
+            displayed += 1
+        next_time += interval
+        delay = next_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    running = False
+    thread.join()
+    source.release()
+
+    print(f"{source.name}, display {display_fps} fps, {seconds} s")
+    print(f"captured {captured} ({captured / seconds:.1f} fps), displayed {displayed} "
+          f"({displayed / seconds:.1f} fps), dropped {buffer.get_dropped_count()}")
+    print(latency.to_text())
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    run(*args)
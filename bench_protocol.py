@@ -0,0 +1,73 @@
+import sys
+import json
+import time
+import random
+from binary_protocol import BinaryFrameSplitter, encode_frame, CURSOR, TRACK
+
+# messages/s of the JSON coordinate messages against the binary frames: the CPU cost of encoding
+# the cursor (GUI -> device) and of finding and decoding the tracked coordinates in the received
+# stream (device -> GUI), and how many fit through the line at the baud rate (10 bits per byte).
+# run: python bench_protocol.py [messages] [baud]
+
+
+def json_cursor(x, y):
+    # what send_joystick_coord writes in the JSON protocol - two messages
+    return (json.dumps({'cursor_x': x}) + json.dumps({'cursor_y': y})).encode()
+
+
+def json_decode_stream(data):
+    # the track_x/track_y part of receive_data_from_serial, without the GUI
+    text = data.decode("utf-8", errors="ignore")
+    coords = []
+    start = text.find('{')
+    while start >= 0:
+        end = text.index('}', start) + 1
+        message = json.loads(text[start:end])
+        coords.append((message['track_x'], message['track_y']))
+        start = text.find('{', end)
+    return coords
+
+
+def binary_decode_stream(data):
+    text, messages = BinaryFrameSplitter().feed(data)
+    return [(x, y) for kind, seq, x, y in messages if kind == TRACK]
+
+
+def measure(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def run(messages, baud):
+    rng = random.Random(0)
+    coords = [(rng.randint(0, 1919), rng.randint(0, 1079)) for _ in range(messages)]
+    line_bytes_per_second = baud / 10
+
+    def encode_json():
+        return [json_cursor(x, y) for x, y in coords]
+
+    def encode_binary():
+        return [encode_frame(CURSOR, i, x, y) for i, (x, y) in enumerate(coords)]
+
+    json_track = b"".join(json.dumps({'track_x': x, 'track_y': y}).encode() for x, y in coords)
+    binary_track = b"".join(encode_frame(TRACK, i, x, y) for i, (x, y) in enumerate(coords))
+
+    print(f"{messages} coordinate pairs, line {baud} baud")
+    print(f"{'':<8} {'cursor bytes':>12} {'encode msg/s':>14} {'track bytes':>12} {'decode msg/s':>14} "
+          f"{'line msg/s':>11}")
+    for name, encode, track, decode in (("JSON", encode_json, json_track, json_decode_stream),
+                                        ("binary", encode_binary, binary_track, binary_decode_stream)):
+        encoded, encode_time = measure(encode)
+        decoded, decode_time = measure(decode, track)
+        assert decoded == coords, f"{name}: decoded coordinates differ"
+        cursor_bytes = sum(len(e) for e in encoded) / messages
+        track_bytes = len(track) / messages
+        print(f"{name:<8} {cursor_bytes:>12.1f} {messages / encode_time:>14.0f} {track_bytes:>12.1f} "
+              f"{messages / decode_time:>14.0f} {line_bytes_per_second / max(cursor_bytes, track_bytes):>11.0f}")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    messages, baud = (args + [100000, 115200][len(args):])[:2]
+    run(messages, baud)
@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+from recorder import VideoRecorder
+
+# sustained encode throughput of VideoRecorder for full resolution recording.
+# frames are fed at the camera rate like VideoCaptureThread does, the recorder must keep up
+# without dropping. run: python bench_recorder.py [seconds] [fps] [fourcc]
+
+
+def make_frames(count=30, shape=(1080, 1920, 3)):
+    # moving gradient, random noise would be unrealistically hard for the encoder
+    y, x = np.mgrid[0:shape[0], 0:shape[1]]
+    frames = []
+    for i in range(count):
+        frame = np.empty(shape, dtype=np.uint8)
+        frame[..., 0] = (x + i * 8) % 256
+        frame[..., 1] = (y + i * 4) % 256
+        frame[..., 2] = ((x + y) // 4 + i * 2) % 256
+        frames.append(frame)
+    return frames
+
+
+def run(frames, seconds, fps, fourcc, paced=True):
+    filename = os.path.join(tempfile.mkdtemp(), "bench.mp4")
+    recorder = VideoRecorder(filename=filename, fps=fps, queue_size=30, full_resolution=True, fourcc=fourcc)
+    recorder.start()
+    interval = 1 / fps
+    count = int(seconds * fps)
+    next_time = time.perf_counter()
+    for i in range(count):
+        # new array per frame like read() does, the recorder keeps the reference
+        recorder.write(frames[i % len(frames)].copy(), time.perf_counter())
+        if paced:
+            next_time += interval
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    recorder.stop()
+    recorder.join()
+    stats = recorder.get_stats()
+    size_mb = os.path.getsize(filename) / 1024 / 1024
+    os.remove(filename)
+    mode = f"paced {fps} fps" if paced else "unpaced"
+    print(f"{mode:<14} fed {count:>5}  written {stats['written']:>5}  dropped {stats['dropped']:>4}  "
+          f"max queue {stats['max_queued']:>2}/{stats['capacity']}  encoder {stats['encode_fps']:6.1f} fps  "
+          f"throughput {stats['throughput']:6.1f} fps  {size_mb:.1f} MB")
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    fps = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    fourcc = sys.argv[3] if len(sys.argv) > 3 else "mp4v"
+    frames = make_frames()
+    print(f"1920x1080 {fourcc}, {seconds:.0f} s")
+    run(frames, seconds, fps, fourcc, paced=True)
+    run(frames, seconds, fps, fourcc, paced=False)
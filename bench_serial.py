@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+import json
+import tty
+import threading
+from serial import Serial
+from serial_writer import SerialWriter
+
+# the old per-character transmit loops against SerialWriter, over a pty loopback (linux/mac):
+# the GUI side writes into the slave end through pyserial, a thread drains the master end and
+# checks that every byte came. a pty has no baud rate - the numbers are the cost on the PC side,
+# the paced mode shows the rate limit it keeps. run: python bench_serial.py [messages] [baud]
+
+
+def legacy_write(ser, text, char_sleep):
+    # the loops the writer replaced: write_to_serial (0.1 ms) and the configs classes (1 ms)
+    for char in text:
+        ser.write(char.encode())
+        time.sleep(char_sleep)
+
+
+def drain(fd, expected, received):
+    while received[0] < expected:
+        data = os.read(fd, 65536)
+        if not data:
+            break
+        received[0] += len(data)
+
+
+def run(name, send, messages, text):
+    master, slave = os.openpty()
+    tty.setraw(slave)           # no line discipline - bytes go through as they are
+    ser = Serial(os.ttyname(slave), timeout=0.1)
+    received = [0]
+    payloads = [text.replace("1234", str(1000 + i % 9000)) for i in range(messages)]
+    expected = sum(len(p.encode()) for p in payloads)
+    reader = threading.Thread(target=drain, args=(master, expected, received), daemon=True)
+    reader.start()
+
+    start = time.perf_counter()
+    writes = send(ser, payloads)
+    sent = time.perf_counter()
+    reader.join(5)
+    elapsed = sent - start
+    ser.close()
+    os.close(master)
+    os.close(slave)
+    ok = "" if received[0] == expected else f" - received only {received[0]} of {expected} bytes"
+    print(f"{name:<28} {messages / elapsed:>10.0f} msg/s {expected / elapsed / 1024:>9.1f} KiB/s "
+          f"{elapsed / messages * 1e6:>9.1f} us/msg {writes:>8} writes{ok}")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    messages, baud = (args + [2000, 115200][len(args):])[:2]
+    text = json.dumps({"cursor_x": 1234, "cursor_y": 567})
+    print(f"{messages} messages of {len(text)} bytes, pty loopback")
+
+    def legacy(char_sleep):
+        def send(ser, payloads):
+            for payload in payloads:
+                legacy_write(ser, payload, char_sleep)
+            return sum(len(p) for p in payloads)
+        return send
+
+    def writer(**options):
+        def send(ser, payloads):
+            serial_writer = SerialWriter(ser, baud_rate=baud, **options)
+            for payload in payloads:
+                serial_writer.send(payload)
+            serial_writer.close(timeout=None)      # paced - the writer thread sends the queue
+            return serial_writer.write_calls
+        return send
+
+    # the per-character loops are slow, fewer messages keep the run short
+    legacy_messages = max(1, messages // 20)
+    run("per char, 1 ms sleep", legacy(0.001), legacy_messages, text)
+    run("per char, 0.1 ms sleep", legacy(0.0001), legacy_messages, text)
+    run("SerialWriter", writer(), messages, text)
+    run(f"SerialWriter paced {baud} 50%", writer(pace=True), legacy_messages, text)
@@ -0,0 +1,125 @@
+import sys
+import json
+import time
+import random
+from serial_parser import JsonMessageFramer
+from session import SessionReader
+
+# the old receive_data_from_serial parsing (index('{')/index('}'), json.loads, str.replace over the
+# whole buffer) against JsonMessageFramer, on megabytes of device traffic in read() sized chunks.
+# the traffic is the serial log of a recorded session (repeated up to the size) or generated:
+# tracking coordinates with temperature answers, [Config] snapshots and noise in between.
+# the same traffic is also run with a few corrupted bytes.
+# run: python bench_serial_parser.py [megabytes] [session folder]
+
+
+class OldParser:
+    # the message loop of receive_data_from_serial before JsonMessageFramer, without the GUI
+    def __init__(self):
+        self.buffer_data = ""
+        self.messages = 0
+
+    def feed(self, text):
+        self.buffer_data += text
+        while '{' in self.buffer_data and '}' in self.buffer_data:
+            ind1 = self.buffer_data.index('{')
+            ind2 = self.buffer_data.index('}') + 1
+            sub_text = self.buffer_data[ind1: ind2]
+            try:
+                json.loads(sub_text)
+            except json.decoder.JSONDecodeError:
+                return
+            self.messages += 1
+            self.buffer_data = self.buffer_data.replace(sub_text, "")
+
+
+def generated_traffic(size, seed=0):
+    rng = random.Random(seed)
+    parts = []
+    total = 0
+    count = 0
+    while total < size:
+        r = rng.random()
+        if r < 0.01:
+            part = "[Config]" + json.dumps({"threshold": rng.randint(0, 255), "match_size": 32, "track_x": 960,
+                                            "track_y": 540, "track_wndw_size": 128, "temperature": 41.5})
+        elif r < 0.05:
+            part = json.dumps({"temperature": round(rng.uniform(30, 60), 1)}) + "\r\n"
+        else:
+            part = json.dumps({"track_x": rng.randint(0, 1919), "track_y": rng.randint(0, 1079)})
+        data = part.encode()
+        parts.append(data)
+        total += len(data)
+        count += 1
+    data = b"".join(parts)
+    # serial.read(1024) with a short timeout - mostly small reads, sometimes a burst
+    chunks = []
+    i = 0
+    while i < len(data):
+        n = rng.choice((rng.randint(1, 64), rng.randint(1, 64), 1024, 4096))
+        chunks.append(data[i:i + n])
+        i += n
+    return chunks, count
+
+
+def recorded_traffic(folder, size):
+    reader = SessionReader(folder)
+    recorded = [data for _, data in reader.serial_between(float("-inf"), float("inf"))]
+    reader.close()
+    if not recorded:
+        raise SystemExit(f"{folder}: no serial data")
+    chunks = []
+    total = 0
+    while total < size:
+        chunks += recorded
+        total += sum(len(c) for c in recorded)
+    return chunks, None
+
+
+def corrupt(chunks, count, seed=1):
+    rng = random.Random(seed)
+    chunks = list(chunks)
+    for _ in range(count):
+        i = rng.randrange(len(chunks))
+        chunk = bytearray(chunks[i])
+        chunk[rng.randrange(len(chunk))] = rng.choice(b'{}"x')
+        chunks[i] = bytes(chunk)
+    return chunks
+
+
+def run(name, chunks, expected, limit=30.0):
+    size = sum(len(c) for c in chunks)
+    framer = JsonMessageFramer()
+    start = time.perf_counter()
+    for chunk in chunks:
+        framer.feed(chunk)
+    framer_time = time.perf_counter() - start
+
+    old = OldParser()
+    start = time.perf_counter()
+    done = 0
+    for chunk in chunks:
+        old.feed(chunk.decode("utf-8", errors="ignore"))
+        done += len(chunk)
+        if time.perf_counter() - start > limit:
+            break
+    old_time = time.perf_counter() - start
+    stopped = "" if done == size else f" (stopped after {done / 2 ** 20:.1f} MB)"
+
+    expected = f" of {expected}" if expected else ""
+    print(f"{name}: {size / 2 ** 20:.1f} MB in {len(chunks)} reads")
+    print(f"  framer      {size / framer_time / 2 ** 20:8.1f} MB/s  {framer.messages} messages{expected}, "
+          f"dropped {framer.dropped}, buffered {len(framer._buffer)} bytes")
+    print(f"  old parser  {done / old_time / 2 ** 20:8.1f} MB/s  {old.messages} messages, "
+          f"buffered {len(old.buffer_data)} characters{stopped}")
+
+
+if __name__ == "__main__":
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 4
+    size = int(megabytes * 2 ** 20)
+    if len(sys.argv) > 2:
+        chunks, count = recorded_traffic(sys.argv[2], size)
+    else:
+        chunks, count = generated_traffic(size)
+    run("clean", chunks, count)
+    run("20 corrupted bytes", corrupt(chunks, 20), count)
@@ -0,0 +1,136 @@
+import re
+import json
+import time
+import struct
+from binascii import crc_hqx
+from serial_writer import write_message
+
+# compact frames for the coordinate streams - the cursor sent to the device and the tracked target
+# sent back. the rest of the traffic (parameters, configs, temperature) stays JSON text.
+# a frame is  0x00  COBS(type, seq, x, y, CRC-16/CCITT)  0x00 : COBS leaves no zero bytes inside,
+# and the JSON text never has zero bytes, so frames and text can share the line.
+# used only when the device answers the {"protocol": 1} request at connect time
+PROTOCOL_VERSION = 1
+CURSOR = 1      # GUI -> device, cursor_x, cursor_y
+TRACK = 2       # device -> GUI, track_x, track_y
+
+MESSAGE = struct.Struct("<BBhh")    # type, seq (wraps at 256), x, y
+CRC = struct.Struct("<H")
+DELIMITER = b"\x00"
+ENCODED_SIZE = MESSAGE.size + CRC.size + 1      # COBS adds one byte to a payload this short
+
+
+def cobs_encode(data: bytes) -> bytes:
+    out = bytearray()
+    for block in data.split(b"\x00"):
+        while len(block) >= 254:
+            out.append(255)
+            out += block[:254]
+            block = block[254:]
+        out.append(len(block) + 1)
+        out += block
+    return bytes(out)
+
+
+def cobs_decode(data: bytes) -> bytes:
+    out = bytearray()
+    i = 0
+    while i < len(data):
+        code = data[i]
+        if code == 0 or i + code > len(data):
+            raise ValueError("broken COBS block")
+        out += data[i + 1:i + code]
+        i += code
+        if code < 255 and i < len(data):
+            out.append(0)
+    return bytes(out)
+
+
+def crc16(data: bytes) -> int:
+    # CRC-16/CCITT-FALSE: poly 0x1021, init 0xffff
+    return crc_hqx(data, 0xFFFF)
+
+
+def encode_frame(kind, seq, x, y) -> bytes:
+    payload = MESSAGE.pack(kind, seq & 0xFF, x, y)
+    return DELIMITER + cobs_encode(payload + CRC.pack(crc16(payload))) + DELIMITER
+
+
+def decode_frame(encoded: bytes):
+    # encoded - without the delimiters. (type, seq, x, y) or None when it isn't a valid frame
+    try:
+        data = cobs_decode(encoded)
+    except ValueError:
+        return None
+    if len(data) != MESSAGE.size + CRC.size:
+        return None
+    payload = data[:MESSAGE.size]
+    if CRC.unpack_from(data, MESSAGE.size)[0] != crc16(payload):
+        return None
+    return MESSAGE.unpack(payload)
+
+
+class BinaryFrameSplitter:
+    # separates the frames from the JSON text in the received bytes, across read() boundaries.
+    # every piece between two zero bytes is tried as a frame and is text if it isn't one, so a
+    # lost delimiter costs one frame and the next ones are found again.
+    # the piece after the last zero is kept for the next read only while it can still become
+    # a frame - JSON text starts with a byte that can't be a COBS code of a frame this short
+    def __init__(self):
+        self._pending = None        # bytes after a zero, waiting for the closing zero
+        self.frames = 0
+        self.crc_errors = 0         # pieces of the size of a frame that failed the check
+
+    def feed(self, data):
+        # returns (text bytes, [(type, seq, x, y)])
+        text = bytearray()
+        messages = []
+        parts = data.split(DELIMITER)
+        last = len(parts) - 1
+        for i, part in enumerate(parts):
+            after_zero = i > 0 or self._pending is not None
+            if i == 0 and self._pending is not None:
+                part = self._pending + part
+            if not after_zero:
+                text += part
+            elif i < last:
+                self._take_piece(part, text, messages)
+            elif len(part) <= ENCODED_SIZE and (not part or part[0] <= ENCODED_SIZE):
+                self._pending = part
+                return bytes(text), messages
+            else:
+                text += part
+        self._pending = None
+        return bytes(text), messages
+
+    def _take_piece(self, piece, text, messages):
+        if not piece:
+            return          # between two frames
+        message = decode_frame(piece) if len(piece) == ENCODED_SIZE else None
+        if message is not None:
+            self.frames += 1
+            messages.append(message)
+        elif len(piece) == ENCODED_SIZE and piece[0] <= ENCODED_SIZE:
+            self.crc_errors += 1
+        else:
+            text += piece
+
+
+_PROTOCOL_ANSWER = re.compile(rb'\{[^{}]*"protocol"[^{}]*\}')
+
+
+def negotiate(ser, timeout=0.5) -> bool:
+    # asks the device for binary coordinate frames, before the serial thread starts reading.
+    # a device that supports them answers {"protocol": 1}. no answer or another one - JSON as before
+    write_message(ser, json.dumps({"protocol": PROTOCOL_VERSION}), framed=False)
+    received = b""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        received += ser.read(ser.in_waiting or 1)
+        match = _PROTOCOL_ANSWER.search(received)
+        if match:
+            try:
+                return json.loads(match.group()).get("protocol") == PROTOCOL_VERSION
+            except json.JSONDecodeError:
+                return False
+    return False
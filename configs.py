@@ -1,4 +1,3 @@
-import time
 import json
 import serial
 
@@ -70,16 +69,11 @@ class Configurations:
     def to_json(self):
         return json.dumps(self.to_dict())
 
-    def write_to_serial(self, uart_ser):
+    def write_to_serial(self, writer):
+        # writer - the SerialWriter of the serial thread, the configs go out through the same lock and queue
         json_repr = self.to_json()
 
-        uart_ser.write(bytes([0xff]))
-
-        for char in json_repr:
-            uart_ser.write(char.encode())
-            time.sleep(0.001)
-
-        uart_ser.write(bytes([0xff]))
+        writer.send(json_repr, framed=True)
 
 
 
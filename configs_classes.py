@@ -1,4 +1,3 @@
-import time
 import json
 import serial
 
@@ -15,16 +14,13 @@ ser.open()
 """
 
 
-def write_response_to_serial(ser, response):
-    print("write_response_to_serial", response)
+# the writers take the SerialWriter of the serial thread - one transmit path with the GUI
 
-    ser.write(bytes([0xff]))
 
-    for char in response:
-        ser.write(char.encode())
-        print(char)
+def write_response_to_serial(writer, response):
+    print("write_response_to_serial", response)
 
-    ser.write(bytes([0xff]))
+    writer.send(response, framed=True)
 
     print("response is sent")
 
@@ -83,65 +79,43 @@ class Inputs:
     def to_json(self):
         return json.dumps(self.to_dict())
 
-    def write_coords_to_serial(self, uart_ser, x_pos=None, y_pos=None):
+    def write_coords_to_serial(self, writer, x_pos=None, y_pos=None):
         self.x_pos = x_pos if x_pos is not None else self.x_pos
         self.y_pos = y_pos if y_pos is not None else self.y_pos
         coords_json = self.to_json_coords()
-        arr = []
 
-        uart_ser.write(bytes([0xff]))
-        for char in "input" + coords_json:
-            uart_ser.write(char.encode())
-            # arr.append(char.encode())
-            time.sleep(0.001)
-        uart_ser.write(bytes([0xff]))
-        print(arr)
+        writer.send("input" + coords_json, framed=True)
         print(f"Successfully changed the inputs to: {coords_json}")
 
-    def write_width_to_serial(self, ser, width):
+    def write_width_to_serial(self, writer, width):
         print("write_width_to_serial w - ", width)
         to_dict = {
             "width": width
         }
         width_to_json = json.dumps(to_dict)
 
-        ser.write(255)
+        writer.send(width_to_json, framed=True)
 
-        for char in width_to_json:
-            ser.write(char.encode())
-            time.sleep(0.001)
-        ser.write(255)
-
-    def write_height_to_serial(self, ser, height):
+    def write_height_to_serial(self, writer, height):
         print("write_height_to_serial h - ", height)
         to_dict = {
             "height": height
         }
         height_to_json = json.dumps(to_dict)
 
-        ser.write(255)
-
-        for char in height_to_json:
-            ser.write(char.encode())
-            time.sleep(0.001)
-        ser.write(255)
+        writer.send(height_to_json, framed=True)
 
-    def write_baud_rate_to_serial(self, ser, bd):
+    def write_baud_rate_to_serial(self, writer, bd):
         print("write_baud_rate_to_serial bd - ", bd)
         to_dict = {
             "baud_rate": bd
         }
         bd_to_json = json.dumps(to_dict)
 
-        ser.write(255)
-
-        for char in bd_to_json:
-            ser.write(char.encode())
-            time.sleep(0.001)
-        ser.write(255)
+        writer.send(bd_to_json, framed=True)
 
 
-    def write_to_serial(self, uart_ser, x_pos=None, y_pos=None, thr=100, dir_thr=100, auto_thr=100, m_size=32):
+    def write_to_serial(self, writer, x_pos=None, y_pos=None, thr=100, dir_thr=100, auto_thr=100, m_size=32):
         self.x_pos = x_pos if x_pos is not None else self.x_pos
         self.y_pos = y_pos if y_pos is not None else self.y_pos
         # self.threshold = thr
@@ -152,20 +126,14 @@ class Inputs:
         inputs_json = self.to_json()
         print("HI")
 
-        uart_ser.write(255)
-        for char in inputs_json:
-            uart_ser.write(char.encode())
-            time.sleep(0.001)
-        uart_ser.write(255)
+        writer.send(inputs_json, framed=True)
 
         print(f"Successfully changed the inputs to: {inputs_json}")
 
 
-def read_inputs(uart_ser):
-    for char in "$data":
-        uart_ser.write(char.encode())
-        time.sleep(0.001)
-    inputs_raw = uart_ser.read(256) or "{}"
+def read_inputs(writer):
+    writer.send("$data")
+    inputs_raw = writer.serial.read(256) or "{}"
     print(inputs_raw)
 
     inputs_dict = json.loads(inputs_raw)
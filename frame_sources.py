@@ -0,0 +1,192 @@
+import sys
+import time
+import cv2
+import numpy as np
+
+
+class FrameSource:
+    # what VideoCaptureThread reads frames from - the part of the cv2.VideoCapture interface it uses.
+    # read() returns (ret, frame): frame is a new BGR array the caller may keep, (True, None) means
+    # nothing new yet (the thread just reads again) and ret False means the source failed.
+    # read() shouldn't block much longer than a frame interval, the thread handles its requests in between.
+    # grab()/retrieve() split read() like in cv2 for the low latency mode, by default grab() reads
+    # the whole frame
+    name = "source"
+
+    def read(self):
+        raise NotImplementedError
+
+    def grab(self):
+        self._grabbed = self.read()
+        return self._grabbed[0]
+
+    def retrieve(self):
+        grabbed, self._grabbed = getattr(self, "_grabbed", (False, None)), (False, None)
+        return grabbed
+
+    def get(self, prop):
+        return 0
+
+    def isOpened(self):
+        return True
+
+    def release(self):
+        pass
+
+
+class CameraSource(FrameSource):
+    # opened on the thread that reads it - some backends (DirectShow) don't like other threads
+    def __init__(self, index, api_pref=cv2.CAP_ANY, width=1920, height=1080):
+        self.name = source_name(("camera", index, api_pref))
+        self.index = index
+        self.capture = cv2.VideoCapture(index, api_pref)
+        self.default_buffer_size = 0
+        if self.capture.isOpened():
+            self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+            self.default_buffer_size = self.capture.get(cv2.CAP_PROP_BUFFERSIZE)
+
+    def read(self):
+        return self.capture.read()
+
+    def grab(self):
+        return self.capture.grab()
+
+    def retrieve(self):
+        return self.capture.retrieve()
+
+    def set_low_latency(self, enabled):
+        # one frame in the driver queue instead of several. not every backend supports it,
+        # grab_latest() drops the queued frames anyway
+        if self.default_buffer_size:
+            self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1 if enabled else self.default_buffer_size)
+
+    def get(self, prop):
+        return self.capture.get(prop)
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def release(self):
+        self.capture.release()
+
+
+class SyntheticSource(FrameSource):
+    # generated frames for load tests without a camera: a static gradient with targets moving
+    # across it, the same frames for the same seed. realtime=True paces read() like a camera at fps,
+    # False gives frames as fast as they are asked for. frame_count=None - endless
+    def __init__(self, width=1920, height=1080, fps=30, targets=3, target_radius=None, seed=0,
+                 realtime=True, frame_count=None):
+        self.name = source_name(("synthetic", {"width": width, "height": height, "fps": fps}))
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.realtime = realtime
+        self.frame_count = frame_count
+        self.frame_number = 0
+        self.target_radius = target_radius or max(4, height // 40)
+        rng = np.random.default_rng(seed)
+        # start positions in 0..1 and speeds in frame sizes per second
+        self._start = rng.random((targets, 2))
+        self._speed = (rng.random((targets, 2)) - 0.5) * 0.6
+        self._colors = [tuple(int(c) for c in rng.integers(64, 256, 3)) for _ in range(targets)]
+
+        y, x = np.mgrid[0:height, 0:width]
+        self._background = np.empty((height, width, 3), dtype=np.uint8)
+        self._background[..., 0] = x * 255 // max(1, width - 1)
+        self._background[..., 1] = y * 255 // max(1, height - 1)
+        self._background[..., 2] = 64
+        self._next_time = None
+        self._released = False
+
+    def target_positions(self, n=None):
+        # pixel centres of the targets in frame n - the ground truth for tracking tests.
+        # they bounce off the frame edges (triangle wave of the travelled distance)
+        n = self.frame_number if n is None else n
+        travelled = self._start + self._speed * n / self.fps
+        bounced = 1 - np.abs(np.mod(travelled, 2) - 1)
+        radius = self.target_radius
+        x = radius + bounced[:, 0] * (self.width - 2 * radius)
+        y = radius + bounced[:, 1] * (self.height - 2 * radius)
+        return np.stack([x, y], axis=1).astype(int)
+
+    def read(self):
+        if self._released:
+            return False, None
+        if self.frame_count is not None and self.frame_number >= self.frame_count:
+            return False, None
+        if self.realtime:
+            now = time.perf_counter()
+            if self._next_time is None or now - self._next_time > 1:
+                self._next_time = now       # the first frame, or the reader was stopped for a while
+            delay = self._next_time - now
+            if delay > 0:
+                time.sleep(delay)
+            self._next_time += 1 / self.fps
+        frame = self._background.copy()
+        for (x, y), color in zip(self.target_positions(), self._colors):
+            cv2.circle(frame, (int(x), int(y)), self.target_radius, color, -1)
+        cv2.putText(frame, str(self.frame_number), (20, 20 + self.height // 20), cv2.FONT_HERSHEY_SIMPLEX,
+                    self.height / 540, (255, 255, 255), max(1, self.height // 360))
+        self.frame_number += 1
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.frame_number
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.frame_count or 0
+        return 0
+
+    def release(self):
+        self._released = True
+
+
+def make_source(spec):
+    # spec is picklable, for sources made in another thread or process:
+    # ("camera", index, api_pref) or ("synthetic", {SyntheticSource kwargs})
+    if spec[0] == "camera":
+        return CameraSource(spec[1], spec[2])
+    if spec[0] == "synthetic":
+        return SyntheticSource(**spec[1])
+    raise ValueError(f"unknown source {spec[0]}")
+
+
+def source_name(spec):
+    # the name of the source make_source(spec) makes, without opening it
+    if spec[0] == "camera":
+        return f"camera {spec[1]}"
+    if spec[0] == "synthetic":
+        options = spec[1]
+        return f"synthetic {options.get('width', 1920)}x{options.get('height', 1080)}@{options.get('fps', 30)}"
+    raise ValueError(f"unknown source {spec[0]}")
+
+
+def grab_latest(source, stale_seconds=0.002, max_grabs=8):
+    # grabs until a grab had to wait for the camera: frames that are there right away were
+    # waiting in the backend queue and are old, the one we had to wait for is fresh.
+    # returns (ret, stale frames skipped)
+    stale = -1
+    for _ in range(max_grabs):
+        start = time.perf_counter()
+        if not source.grab():
+            return False, max(0, stale)
+        stale += 1
+        if time.perf_counter() - start > stale_seconds:
+            break
+    return True, stale
+
+
+def camera_backend():
+    # the backend cameras are listed and opened with on this platform
+    if sys.platform.startswith("win"):
+        return cv2.CAP_DSHOW        # cv2.CAP_MSMF
+    if sys.platform.startswith("linux"):
+        return cv2.CAP_V4L2
+    return cv2.CAP_ANY
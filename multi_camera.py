@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import deque
+from video_pipeline import LatestFrameBuffer, FramePreparer, FpsCounter, LatencyStats
+
+
+class CaptureStream:
+    # one camera of the multi-camera view: its source, preparer, latest frame buffer and stats.
+    # the source is made by source_factory on the stream's reader thread (cameras want that)
+    def __init__(self, name, source_factory, display_shape=(360, 640)):
+        self.name = name
+        self.source_factory = source_factory
+        self.source = None
+        self.preparer = FramePreparer(display_shape=display_shape)
+        self.buffer = LatestFrameBuffer(on_release=self.preparer.release)
+        self.capture_fps = FpsCounter()
+        self.display_fps = FpsCounter()     # ticked by the GUI when it paints a frame
+        self.latency = LatencyStats()
+        self.running = True
+        self.error = None
+        self.seq = 0
+        self.coalesced_frames = 0   # read, but a newer frame came before a worker prepared them
+        self._pending = None        # (frame, capture_time) waiting for a worker
+        self._queued = False        # in the scheduler's ready queue
+        self._busy = False          # a worker is preparing a frame of this stream
+        self._thread = None
+
+    def get_stats(self):
+        return {
+            "capture_fps": self.capture_fps.get_fps(),
+            "display_fps": self.display_fps.get_fps(),
+            "coalesced": self.coalesced_frames,
+            "dropped": self.buffer.get_dropped_count(),
+            "total_p95": self.latency.histograms["total"].percentile(95),
+            "error": self.error,
+        }
+
+
+class CaptureScheduler:
+    # the capture and preparation work of all the streams of the multi-camera view.
+    # reading blocks on the camera, so every stream has a light reader thread (cv2 releases the GIL
+    # while waiting and decoding). preparing (resize + colour conversion) is done by a shared pool of
+    # `workers` threads: a stream has at most one frame waiting and one being prepared, a newer frame
+    # replaces the waiting one, and the streams are served in the order their frames came.
+    # so 2-3 cameras at 1080p cost at most `workers` cores of preparing, and a slow stream
+    # can't make the others wait behind a queue of its frames
+    def __init__(self, workers=2):
+        self.streams = []
+        self._cond = threading.Condition()
+        self._ready = deque()       # streams with a waiting frame
+        self._exiting = []          # reader threads of removed streams, maybe still in read()
+        self.running = True
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def add_stream(self, name, source_factory, display_shape=(360, 640)) -> CaptureStream:
+        stream = CaptureStream(name, source_factory, display_shape)
+        with self._cond:
+            # the same camera may still be held by the reader of a stream that was just removed
+            self._exiting = [thread for thread in self._exiting if thread.is_alive()]
+            stream._thread = threading.Thread(target=self._read, args=(stream, list(self._exiting)), daemon=True)
+            self.streams.append(stream)
+        stream._thread.start()
+        return stream
+
+    def remove_stream(self, stream):
+        # the reader releases the source when it leaves read(), new streams wait for that
+        stream.running = False
+        with self._cond:
+            if stream in self.streams:
+                self.streams.remove(stream)
+            if stream in self._ready:
+                self._ready.remove(stream)
+                stream._queued = False
+            stream._pending = None
+            # a worker preparing a frame of this stream would put it after the clear
+            self._cond.wait_for(lambda: not stream._busy, timeout=2)
+            self._exiting.append(stream._thread)
+        stream._thread.join(2)
+        stream.buffer.clear()
+
+    def stop(self):
+        for stream in list(self.streams):
+            self.remove_stream(stream)
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(2)
+
+    def _read(self, stream, exiting):
+        try:
+            for thread in exiting:
+                thread.join()
+            if not stream.running:
+                return
+            stream.source = stream.source_factory()
+            if not stream.source.isOpened():
+                stream.error = "couldn't be opened"
+                return
+            while stream.running:
+                read_start = time.perf_counter()
+                ret, frame = stream.source.read()
+                capture_time = time.perf_counter()
+                if not ret:
+                    stream.error = "no frames"
+                    time.sleep(0.03)
+                    continue
+                if frame is None:
+                    continue
+                stream.error = None
+                stream.latency.record("capture", capture_time - read_start)
+                stream.capture_fps.tick(capture_time)
+                with self._cond:
+                    if not stream.running:
+                        break       # removed while it was reading
+                    if stream._pending is not None:
+                        stream.coalesced_frames += 1
+                    stream._pending = (frame, capture_time)
+                    if not stream._queued and not stream._busy:
+                        stream._queued = True
+                        self._ready.append(stream)
+                        self._cond.notify()
+        except Exception as e:
+            stream.error = str(e)
+            print(f"{stream.name}: {e}")
+        finally:
+            if stream.source is not None:
+                stream.source.release()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while self.running and not self._ready:
+                    self._cond.wait()
+                if not self.running:
+                    return
+                stream = self._ready.popleft()
+                stream._queued = False
+                frame, capture_time = stream._pending
+                stream._pending = None
+                stream._busy = True
+            try:
+                stream.seq += 1
+                prepared = stream.preparer.prepare(frame, seq=stream.seq, capture_time=capture_time)
+                stream.latency.record("prepare", prepared.prepared_time - capture_time)
+                stream.buffer.put(prepared)
+            finally:
+                with self._cond:
+                    stream._busy = False
+                    self._cond.notify_all()     # remove_stream may wait for it
+                    # a frame that came meanwhile waits for the next free worker
+                    if stream._pending is not None and stream.running and not stream._queued:
+                        stream._queued = True
+                        self._ready.append(stream)
+                        self._cond.notify()
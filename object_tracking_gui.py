@@ -6,23 +6,34 @@ import json
 import pygame
 import os
 from collections import deque
-from multiprocessing import Process
 import numpy as np
 import socket
 import copy
+import shutil
 from math import ceil
 from traceback import print_exc
 from serial import Serial
 from serial.tools import list_ports
 from serial import SerialException, SerialTimeoutException
-from threading import Thread
+from threading import Thread, Lock
 from difflib import SequenceMatcher
 from functools import partial
 from ast import literal_eval
 from joystickclass import JoystickThread
 from cv2_enumerate_cameras import enumerate_cameras
 from configs_classes import Inputs, read_inputs, write_response_to_serial
-from PyQt5.QtCore import QTimer, QThread, pyqtSignal, pyqtSlot, Qt
+from serial_writer import SerialWriter, CursorQueue, write_message
+from binary_protocol import BinaryFrameSplitter, encode_frame, negotiate, CURSOR, TRACK
+from serial_parser import JsonMessageFramer, decode_message, TRACKING, CONFIG, PARAMETER, TEMPERATURE, STATUS, \
+    DISCONNECTED
+from video_pipeline import AdaptiveQuality, LatestFrameBuffer, FramePreparer, FpsCounter, LatencyStats, rgb_to_qimage
+from recorder import VideoRecorder, PreEventBuffer, RecordingOverlay, make_recording_filename
+from session import SessionWriter, make_session_folder
+from playback import PlaybackSource
+from frame_sources import CameraSource, SyntheticSource, camera_backend, grab_latest, make_source
+from shm_capture import ProcessCapture, SharedFrame
+from multi_camera import CaptureScheduler
+from PyQt5.QtCore import QTimer, QThread, QMutex, QWaitCondition, pyqtSignal, pyqtSlot, Qt
 from PyQt5.QtGui import QImage, QPainter, QColor, QPen, QKeyEvent, QMovie, QIntValidator
 from PyQt5.QtWidgets import (
     QApplication,
@@ -43,6 +54,7 @@ from PyQt5.QtWidgets import (
     QRadioButton,
     QGroupBox,
     QFileDialog,
+    QSlider,
     QMessageBox,
     QDialogButtonBox,
     QPlainTextEdit,
@@ -92,17 +104,6 @@ def list_open_com_ports():     # skip bluetooth ports
     return open_ports
 
 
-def write_to_serial(ser, js):
-    print("write_to_serial", js)
-    #ser.write(bytes([0xff]))
-
-    for char in js:
-        ser.write(char.encode())
-        time.sleep(0.0001)
-
-    #ser.write(bytes([0xff]))
-
-
 
 class Toggle(QCheckBox):
     def __init__(self, parent=None):
@@ -137,74 +138,343 @@ class Toggle(QCheckBox):
 
 
 class VideoCaptureThread(QThread):
-    change_frame_signal = pyqtSignal(np.ndarray)
+    # frames are not sent through a signal - they are put in frame_buffer and the GUI
+    # render timer takes the latest one at the display rate.
+    # the thread lives for the whole app: without a camera it sleeps on a wait condition
+    # and the GUI shows its cached placeholder pixmap.
+    # frames come from a FrameSource - a camera, a played recording (PlaybackSource) or
+    # a generated one (SyntheticSource), they all take the same way to the screen.
+    # with a ProcessCapture the reading and preparing happen in a child process, this thread
+    # only takes the shared memory frames and hands them on
     camera_ready_signal = pyqtSignal()
+    idle_signal = pyqtSignal()      # no frames are coming - show the placeholder
 
-    def __init__(self, index, api_pref, default_frame=None):
+    def __init__(self):
         super().__init__()
-        self._index = index
-        self._api_pref = api_pref
-        self._default_frame = default_frame.copy() if default_frame is not None else None
+        self._index = None
+        self._api_pref = None
         self.running = True
-
-        if index is not None:
-            self.video_capture = cv2.VideoCapture(self._index, self._api_pref)
-            self.video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, 1920)
-            self.video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
-        else:
-            self.video_capture = None
+        self.video_capture = None   # FrameSource
+        self.playback = None        # PlaybackSource when a recording is played, the GUI controls it
+        self.process_capture = None     # ProcessCapture instead of video_capture
+        # resize/colour conversion happens here, the GUI gets display-ready RGB buffers.
+        # frames released by the buffer go back to the preparer (or the shared memory ring) to be reused
+        self.preparer = FramePreparer()
+        self.frame_buffer = LatestFrameBuffer(on_release=self._release_frame)
+        self.capture_fps = FpsCounter()
+        self.latency = LatencyStats()     # capture/prepare here, queue/paint/total in the GUI
+        self.display_quality = AdaptiveQuality()     # prepare time recorded here, paint time in the GUI
+        self.frame_seq = 0
+        self.recorder = None              # VideoRecorder, set by the GUI while recording
+        self.pre_event_buffer = None      # PreEventBuffer, fed while there is no recording
+        self.pre_event_full_resolution = False
+        self.overlay = RecordingOverlay()  # snapshot goes with every recorded frame
+        # low latency mode: small driver queue, stale queued frames are grabbed and thrown away and
+        # a frame is decoded (retrieve) only if it will be displayed or recorded
+        self.low_latency = False
+        self._low_latency_applied = False
+        self.display_interval = 1 / 30     # the GUI render rate, set by the GUI
+        self.grab_fps = FpsCounter()
+        self.stale_frames = 0               # thrown away because they waited in the driver queue
+        self.undecoded_frames = 0           # grabbed but not retrieved - a newer frame was displayed
+        self.ready_time = 0.0               # smoothed, from the capture (grab) until the frame is prepared
+
+        self._mutex = QMutex()
+        self._condition = QWaitCondition()
+        self._request = None    # ("open", index, api_pref) or ("close",), handled on this thread
 
 
     def get_index(self):
         return self._index
 
+    def get_fps(self):
+        if self.video_capture is None:
+            return 0
+        return self.video_capture.get(cv2.CAP_PROP_FPS)
+
+    def get_dropped_frames(self):
+        # frames that were replaced by a newer one before the GUI took them
+        return self.frame_buffer.get_dropped_count()
+
+    def open_camera(self, index, api_pref):
+        self._post_request(("open", index, api_pref))
+
+    def close_camera(self):
+        self._post_request(("close",))
+
+    def open_file(self, path):
+        self._post_request(("play", path))
+
+    def open_source(self, source):
+        # any FrameSource made by the caller, the thread owns and releases it from now on
+        self._post_request(("source", source))
+
+    def open_process_capture(self, source_spec):
+        # source_spec - see shm_capture.make_source, the source is made in the child process
+        self._post_request(("process", source_spec))
+
+    def _post_request(self, request):
+        self._mutex.lock()
+        self._request = request
+        self._condition.wakeAll()
+        self._mutex.unlock()
+
+    def _handle_request(self, request):
+        self._release_capture()
+        self.frame_buffer.clear()
+        self.capture_fps.reset()
+        self.grab_fps.reset()
+        self.frame_seq = 0
+        self.stale_frames = 0
+        self.undecoded_frames = 0
+        self.ready_time = 0.0
+        self._low_latency_applied = False
+        if self.pre_event_buffer is not None:
+            self.pre_event_buffer.clear()     # frames of the previous camera
+        source = None
+        if request[0] == "open":
+            # cameras are opened here, on the thread that reads them
+            self._index, self._api_pref = request[1], request[2]
+            source = CameraSource(self._index, self._api_pref)
+        elif request[0] == "play":
+            self._index = request[1]
+            try:
+                source = PlaybackSource(self._index)
+            except (OSError, ValueError) as e:
+                print(f"couldn't open {self._index}: {e}")
+        elif request[0] == "source":
+            source = request[1]
+            self._index = source.name
+        elif request[0] == "process":
+            try:
+                self.process_capture = ProcessCapture(request[1], display_shape=self.preparer.display_shape)
+                self.process_capture.start()
+                self._index = self.process_capture.name
+                return
+            except OSError as e:
+                print(f"couldn't start the capture process: {e}")
+                self.process_capture = None
+        if source is not None:
+            if source.isOpened():
+                self.video_capture = source
+                if isinstance(source, PlaybackSource):
+                    self.playback = source
+                return
+            print(f"{source.name} couldn't be opened")
+            source.release()
+        self._index = None
+        self.idle_signal.emit()
+
+    def _release_capture(self):
+        if self.video_capture is not None:
+            self.video_capture.release()
+            self.video_capture = None
+            print(f"{self._index} released, dropped frames: {self.get_dropped_frames()}")
+        if self.process_capture is not None:
+            self.frame_buffer.clear()       # the slots go back before the ring is closed
+            print(f"{self._index} stopped, {self.process_capture.get_stats()}")
+            self.process_capture.stop()
+            self.process_capture = None
+        self.playback = None
+        self._index = None
+
+    def get_capture_fps(self):
+        return self.capture_fps.get_fps()
+
+    def set_low_latency(self, enabled):
+        # applied to the source on this thread before the next read
+        self.low_latency = enabled
+
+    def _read_low_latency(self):
+        ret, stale = grab_latest(self.video_capture)
+        capture_time = time.perf_counter()
+        if not ret:
+            return False, None, capture_time
+        self.grab_fps.tick(capture_time)
+        self.stale_frames += stale
+        grab_fps = self.grab_fps.get_fps()
+        # the frame has to be decoded and prepared before the GUI takes it
+        needed = self.recorder is not None or self.pre_event_buffer is not None or \
+            self.frame_buffer.will_be_taken(capture_time, self.display_interval, 1 / grab_fps if grab_fps else 0,
+                                            margin=0.004 + self.ready_time)
+        if not needed:
+            self.undecoded_frames += 1
+            return True, None, capture_time
+        ret, frame = self.video_capture.retrieve()
+        return ret, frame, capture_time
+
+    def _release_frame(self, prepared):
+        if isinstance(prepared, SharedFrame):
+            prepared.owner.release(prepared)
+        else:
+            self.preparer.release(prepared)
+
+    def wants_original(self):
+        # the camera frames are kept - full resolution recording or pre-event buffer
+        return (self.recorder is not None and self.recorder.full_resolution) or \
+            (self.recorder is None and self.pre_event_buffer is not None and self.pre_event_full_resolution)
+
+    def _read_process_capture(self):
+        capture = self.process_capture
+        # the child copies the camera frames too only when something records them,
+        # otherwise just the track window region
+        capture.set_want_original(self.wants_original())
+        capture.set_track_box(self.preparer.track_window_box(capture.last_shape) if capture.last_shape else None)
+        frame = capture.wait_frame(timeout=0.05)
+        if frame is not None:
+            self.publish_shared_frame(frame)
+        elif not capture.check():
+            # crashed too often or the camera can't be opened
+            self._release_capture()
+            self.idle_signal.emit()
+
+    def publish_shared_frame(self, frame):
+        # resized and converted by the capture process, only the track window crop is left
+        self.capture_fps.tick(frame.capture_time)
+        self.frame_seq += 1
+        frame.seq = self.frame_seq
+        self.latency.record("prepare", frame.prepared_time - frame.capture_time)
+        self.display_quality.record_prepare(frame.prepared_time - frame.capture_time)
+        self.preparer.crop_track_window(frame)
+        # the slot is reused by the child, whatever is kept gets its own copy
+        original = frame.original.copy() if frame.original is not None and self.wants_original() else None
+        self._deliver(frame, original)
+
+    def publish_frame(self, frame, capture_time):
+        self.capture_fps.tick(capture_time)
+        self.frame_seq += 1
+        prepared = self.preparer.prepare(frame, seq=self.frame_seq, capture_time=capture_time)
+        ready = prepared.prepared_time - capture_time      # with the retrieve() in the low latency mode
+        self.latency.record("prepare", ready)
+        self.display_quality.record_prepare(ready)
+        self.ready_time += (ready - self.ready_time) * 0.1
+        self._deliver(prepared, frame)
+
+    def _deliver(self, prepared, frame):
+        # frame - the original camera frame, None if the capture process didn't copy it
+        capture_time = prepared.capture_time
+        shape = prepared.original_shape
+        recorder = self.recorder
+        if recorder is not None or self.pre_event_buffer is not None:
+            overlay = self.overlay.snapshot(self.preparer.get_track_window(),
+                                            self.preparer.track_window_box(shape), shape)
+        if recorder is not None:
+            if recorder.full_resolution:
+                # read() gives a new array every time, so the original frame can go as it is
+                if frame is not None:
+                    recorder.write(frame, capture_time, overlay)
+            else:
+                # the resized BGR buffer is reused by the preparer - the recorder gets its own copy
+                recorder.write(prepared.resized.copy(), capture_time, overlay)
+        elif self.pre_event_buffer is not None:
+            if self.pre_event_full_resolution:
+                if frame is not None:
+                    self.pre_event_buffer.add(frame, capture_time, overlay)
+            else:
+                self.pre_event_buffer.add(prepared.resized.copy(), capture_time, overlay)
+        self.frame_buffer.put(prepared)
+
     def run(self):
         self.running = True
-        if self.video_capture and self.video_capture.isOpened():
-            while self.running:
+        read_failed = False
+        while self.running:
+            self._mutex.lock()
+            # idle - sleep until a camera is opened or the thread is stopped
+            while self.running and self._request is None and self.video_capture is None \
+                    and self.process_capture is None:
+                self._condition.wait(self._mutex)
+            request = self._request
+            self._request = None
+            self._mutex.unlock()
+
+            if not self.running:
+                break
+            if request is not None:
+                self._handle_request(request)
+                read_failed = False
+                continue
+            if self.process_capture is not None:
+                self._read_process_capture()
+                continue
+
+            if self._low_latency_applied != self.low_latency:
+                self._low_latency_applied = self.low_latency
+                if hasattr(self.video_capture, "set_low_latency"):
+                    self.video_capture.set_low_latency(self.low_latency)
+
+            read_start = time.perf_counter()
+            if self.low_latency and self.playback is None:
+                ret, frame, capture_time = self._read_low_latency()
+            else:
                 ret, frame = self.video_capture.read()
-                if ret:
-                    self.change_frame_signal.emit(frame)
-                else:
-                    if self._default_frame is not None:
-                        self.change_frame_signal.emit(self._default_frame)
-                    self.msleep(30)
-        else:
-            while self.running:
-                if self._default_frame is not None:
-                    self.change_frame_signal.emit(self._default_frame)
+                capture_time = time.perf_counter()
+            if ret and frame is None:
+                # playback is paused or the next frame isn't due yet, or (low latency) the frame
+                # wasn't decoded because a newer one will be displayed instead
+                continue
+            if ret:
+                self.latency.record("capture", capture_time - read_start)
+                self.publish_frame(frame, capture_time)
+                read_failed = False
+            else:
+                if not read_failed:
+                    self.idle_signal.emit()
+                    read_failed = True
                 self.msleep(30)
 
+        self._release_capture()
+
 
     def stop(self):
+        self._mutex.lock()
         self.running = False
+        self._condition.wakeAll()
+        self._mutex.unlock()
         self.wait()
-        if self.video_capture:
-            self.video_capture.release()
-            self.video_capture = None
 
 
 class SerialThread(QThread):
     # serial thread for sending data and receiving
-    received_data_signal = pyqtSignal(str)
+    # the received data is framed and decoded here, the GUI thread gets ready events:
+    # (kind, payload, arrival time - time.perf_counter()), kinds from serial_parser
+    event_signal = pyqtSignal(str, object, float)
+    # tracking coordinates come too often for a signal each - they wait in a list and this is
+    # emitted only when the list was empty, the GUI takes all of them with take_tracking_coords()
+    tracking_coords_signal = pyqtSignal()
     send_text_signal = pyqtSignal(str)
     send_bytes_signal = pyqtSignal(bytes)
-    send_joystick_coordinates_with_interval = pyqtSignal(str, str)
+    send_cursor_signal = pyqtSignal(int, int)       # cursor_x, cursor_y - rate limited, the newest is always sent
     send_joystick_coordinates = pyqtSignal(str, str)
 
 
-    def __init__(self, ser):
+    def __init__(self, ser, pace=False, binary=False, cursor_rate=30):
         super().__init__()
         self.serial = ser
+        # whole messages in one write; pace - for firmware that can't take bytes at the full baud rate
+        self.writer = SerialWriter(ser, pace=pace)
+        # binary - the device agreed to binary coordinate frames at connect (binary_protocol.negotiate)
+        self.binary = binary
+        self.splitter = BinaryFrameSplitter() if binary else None
+        self.cursor_seq = 0
+        self.framer = JsonMessageFramer()
+        self._lock = Lock()
+        self._tracking_coords = deque(maxlen=4096)     # (x, y, arrival time) not taken by the GUI yet
+        self.coalesced_coords = 0       # coordinates that came while the GUI was still to take others
+        self._log = []                  # received text for the device log
         self.running = True
         self.first_open = True
-        self.coord_last_sent = 0
-        self.coord_send_interval = 0.03   # 60 hz
+        # cursor positions: only the newest waits, sent at most cursor_rate times a second
+        self.cursor_queue = CursorQueue(interval=1 / cursor_rate)
+        self.cursor_timer = QTimer()
+        self.cursor_timer.setSingleShot(True)
+        self.cursor_timer.setTimerType(Qt.PreciseTimer)
+        self.cursor_timer.timeout.connect(self.flush_cursor)
+        self.session = None     # SessionWriter, gets the raw data with the arrival times while recording
 
         self.send_text_signal.connect(self.send_text_data)
         self.send_bytes_signal.connect(self.send_bytes_data)
         self.send_joystick_coordinates.connect(self.send_joystick_coord)
-        self.send_joystick_coordinates_with_interval.connect(self.send_joystick_coord_with_interval)
+        self.send_cursor_signal.connect(self.queue_cursor)
         print("SerialThread initialized")
 
 
@@ -224,20 +494,37 @@ class SerialThread(QThread):
     """
 
     def run(self):
-        buffer = bytearray()
-
         while self.running:
             try:
                 data = self.serial.read(1024)  # waits up to timeout
                 if not data:
                     continue
-
-                buffer.extend(data)
-
-                text = buffer.decode("utf-8", errors="ignore")
-                buffer.clear()
-                if self.running:
-                    self.received_data_signal.emit(text)
+                # the same clock as the capture timestamps of the video frames
+                arrival_time = time.perf_counter()
+                session = self.session
+                if session is not None:
+                    session.add_serial(data, arrival_time)
+
+                if self.splitter is not None:
+                    data, messages = self.splitter.feed(data)
+                    for kind, seq, x, y in messages:
+                        if kind == TRACK:
+                            self.add_tracking_coord(x, y, arrival_time)
+                    if not data:
+                        continue
+
+                with self._lock:
+                    self._log.append(data.decode("utf-8", errors="ignore"))
+                for message in self.framer.feed(data):
+                    kind, payload = decode_message(message)
+                    if kind == TRACKING:
+                        self.add_tracking_coord(payload[0], payload[1], arrival_time)
+                    elif self.running:
+                        self.event_signal.emit(kind, payload, arrival_time)
+                if self.framer.disconnected:
+                    self.framer.disconnected = False
+                    if self.running:
+                        self.event_signal.emit(DISCONNECTED, None, arrival_time)
 
             except serial.SerialException:
                 if self.serial.is_open:
@@ -251,23 +538,86 @@ class SerialThread(QThread):
         print("serial stopped")
 
 
-    def send_joystick_coord_with_interval(self, json_x, json_y):
-        now = time.time()
-        if now - self.coord_last_sent >= self.coord_send_interval:
-            self.send_joystick_coord(json_x, json_y)
+    def add_tracking_coord(self, x, y, arrival_time):
+        session = self.session
+        if session is not None:
+            session.add_tracking(arrival_time, x, y)
+        with self._lock:
+            notify = not self._tracking_coords
+            if not notify:
+                self.coalesced_coords += 1
+            self._tracking_coords.append((x, y, arrival_time))
+        if notify and self.running:
+            self.tracking_coords_signal.emit()
+
+
+    def take_tracking_coords(self):
+        with self._lock:
+            coords = list(self._tracking_coords)
+            self._tracking_coords.clear()
+        return coords
+
+
+    def take_log(self) -> str:
+        with self._lock:
+            text = "".join(self._log)
+            self._log = []
+        return text
+
+
+    def queue_cursor(self, x, y):
+        # replaces a position that wasn't sent yet - moving the mouse can't flood the line
+        self.cursor_queue.put((x, y))
+        self.flush_cursor()
+
+
+    def flush_cursor(self):
+        now = time.perf_counter()
+        delay = self.cursor_queue.due_in(now)
+        if delay is None:
+            return
+        if delay > 0:
+            # the timer sends it when the rate allows, unless a newer position does it first
+            if not self.cursor_timer.isActive():
+                self.cursor_timer.start(max(1, ceil(delay * 1000)))
+            return
+        x, y = self.cursor_queue.take(now)
+        self.send_cursor(x, y)
+
+
+    def send_cursor(self, x, y):
+        # x and y in one message: an 11 byte frame in the binary protocol, one JSON object otherwise
+        try:
+            if self.binary:
+                self.cursor_seq = (self.cursor_seq + 1) & 0xFF
+                self.writer.send(encode_frame(CURSOR, self.cursor_seq, x, y))
+            else:
+                self.writer.send(json.dumps({'cursor_x': x, 'cursor_y': y}))
+        except Exception as e:
+            print(f"Send Error: {e}")
 
 
     def send_joystick_coord(self, json_x, json_y):
-        now = time.time()
-        self.send_text_data(json_x)
-        self.send_text_data(json_y)
-        self.coord_last_sent = now
+        # the joystick button sends track_x/track_y through here too - only the cursor has a frame type
+        cursor = self.binary and '"cursor_x"' in json_x and '"cursor_y"' in json_y
+        if cursor:
+            # both coordinates in one 11 byte frame instead of two JSON messages
+            try:
+                x = json.loads(json_x)['cursor_x']
+                y = json.loads(json_y)['cursor_y']
+                self.cursor_seq = (self.cursor_seq + 1) & 0xFF
+                self.writer.send(encode_frame(CURSOR, self.cursor_seq, x, y))
+            except Exception as e:
+                print(f"Send Error: {e}")
+        else:
+            self.send_text_data(json_x)
+            self.send_text_data(json_y)
 
 
     @pyqtSlot(str)
     def send_text_data(self, js_data):
         try:
-            write_to_serial(ser=self.serial, js=js_data)
+            self.writer.send(js_data)
             print(f"Sent text data: {js_data}")  # Debug log
         except Exception as e:
             print(f"Send Error: {e}")
@@ -281,7 +631,7 @@ class SerialThread(QThread):
             if self.serial is None or not self.serial.is_open:
                 print("Serial port not open or not connected.")
                 return
-            self.serial.write(bytes_data)  # Send raw bytes
+            self.writer.send(bytes_data)  # Send raw bytes
             print(f"Sent bytes: {bytes_data.hex()}")  # debug the hex
         except BaseException as e:
             print("Caught exception in send_bytes_data:")
@@ -291,6 +641,8 @@ class SerialThread(QThread):
 
     def stop(self):
         self.running = False
+        self.cursor_timer.stop()
+        self.writer.close()
         try:
             if self.serial and self.serial.is_open:
                 self.serial.close()
@@ -302,7 +654,7 @@ class SerialThread(QThread):
 
 def get_available_cameras():
     cameras = []
-    for camera_info in enumerate_cameras(cv2.CAP_DSHOW):  # cv2.CAP_MSMF
+    for camera_info in enumerate_cameras(camera_backend()):
         cameras.append((camera_info.name, camera_info.index, camera_info.backend))
 
     return cameras
@@ -321,19 +673,30 @@ class MainApp(QMainWindow):
         self.video_label = QLabel(self)
         self.video_label_deviation = [50, 50]
         self.video_label.setGeometry(self.video_label_deviation[0], self.video_label_deviation[1], 960, 540)
-        # until there is no video, it will be gray frame
-                                        # h     w    ch
-        self.gray_frame = np.full((1080, 1920, 3), 128, dtype=np.uint8)    # was (1920,1080, 3) VARDAN
+        # until there is no video, it will be gray frame - rendered once and reused
         self.gray_pixmap = QtGui.QPixmap(self.video_label.width(), self.video_label.height())
         self.gray_pixmap.fill(Qt.darkGray)
         self.video_label.setPixmap(self.gray_pixmap)
 
-        self.video_thread = VideoCaptureThread(index=None, api_pref=None, default_frame=self.gray_frame)
+        # the thread is idle (sleeping) until a camera is opened
+        self.video_thread = VideoCaptureThread()
         self.video_thread.camera_ready_signal.connect(self.hide_loading)
-        self.video_thread.change_frame_signal.connect(self.update_frame)
+        self.video_thread.idle_signal.connect(self.show_placeholder)
         self.video_thread.start()
         print("self.video_thread", self.video_thread)
 
+        # repaint at the display rate from the latest captured frame, independent of the camera rate
+        self.display_fps = 30
+        self.display_fps_counter = FpsCounter()
+        self.painted_frames = 0         # since the source was opened, only frames that reached the screen
+        self.render_timer = QTimer(self)
+        self.render_timer.setTimerType(Qt.PreciseTimer)
+        self.render_timer.setInterval(int(1000 / self.display_fps))
+        self.render_timer.timeout.connect(self.render_latest_frame)
+        self.displayed_frame = None             # PreparedFrame currently on the screen
+        self.displayed_track_window = None
+        self.last_render_tick = None            # how late the timer fires tells how busy this thread is
+
         #labels and widgets on the gui
         self.stabilization_label = QLabel('Stabilization', self)
         self.stabilization_label.setGeometry(910, 15, 100, 30)
@@ -387,10 +750,78 @@ class MainApp(QMainWindow):
         self.temperature_label.hide()
         self.temperature_line_edit.hide()
 
+        # capture and display rate are measured separately
+        self.capture_fps_label = QLabel("Capture fps", self)
+        self.capture_fps_label.setGeometry(885, 655, 70, 30)
+        self.capture_fps_line_edit = QLineEdit(self)
+        self.capture_fps_line_edit.setGeometry(970, 660, 40, 20)
+        self.capture_fps_line_edit.setReadOnly(True)
+        self.capture_fps_line_edit.setText('0')
+        self.display_fps_label = QLabel("Display fps", self)
+        self.display_fps_label.setGeometry(885, 685, 70, 30)
+        self.display_fps_line_edit = QLineEdit(self)
+        self.display_fps_line_edit.setGeometry(970, 690, 40, 20)
+        self.display_fps_line_edit.setReadOnly(True)
+        self.display_fps_line_edit.setText('0')
+        self.capture_fps_label.hide()
+        self.capture_fps_line_edit.hide()
+        self.display_fps_label.hide()
+        self.display_fps_line_edit.hide()
+
+        self.fps_report_timer = QTimer(self)
+        self.fps_report_timer.setInterval(1000)
+        self.fps_report_timer.timeout.connect(self.report_fps)
+
+        # L click - shows/hides latency histograms, D click - appends them to the file
+        self.latency_file = "latency_histograms.txt"
+        self.latency_view = QPlainTextEdit(self)
+        self.latency_view.setGeometry(1070, 400, 500, 330)
+        self.latency_view.setReadOnly(True)
+        self.latency_view.setFocusPolicy(Qt.NoFocus)
+        self.latency_view.setStyleSheet("font-family: monospace; font-size: 10px;")
+        self.latency_view.hide()
+        self.latency_timer = QTimer(self)
+        self.latency_timer.setInterval(1000)
+        self.latency_timer.timeout.connect(self.report_latency)
+
         self.available_cameras_label = QLabel(self)
         self.available_cameras_label.setText("Available Cameras:")
         self.available_cameras_label.setGeometry(140, 700, 150, 30)
 
+        self.display_rate_label = QLabel("Display fps:", self)
+        self.display_rate_label.setGeometry(430, 700, 80, 30)
+        self.display_rate_combobox = QComboBox(self)
+        self.display_rate_combobox.setGeometry(510, 705, 60, 30)
+        self.display_rates = [15, 25, 30, 60]
+        self.display_rate_combobox.addItems([str(r) for r in self.display_rates])
+        self.display_rate_combobox.setCurrentText(str(self.display_fps))
+        self.display_rate_combobox.currentIndexChanged.connect(
+            lambda ind: self.set_display_fps(self.display_rates[ind]))
+
+        # fresher frames: the driver queue is drained and only the displayed frames are decoded
+        self.low_latency_checkbox = QCheckBox("Low latency", self)
+        self.low_latency_checkbox.setGeometry(580, 700, 100, 30)
+        self.low_latency_checkbox.stateChanged.connect(self.set_low_latency)
+
+        # capture and resize in a separate process, frames come through shared memory.
+        # used by the next Open camera
+        self.process_capture_checkbox = QCheckBox("Capture process", self)
+        self.process_capture_checkbox.setGeometry(690, 700, 130, 30)
+
+        # cheaper video painting when the machine is busy, so the pointer and the controls stay responsive
+        self.adaptive_quality_checkbox = QCheckBox("Adaptive quality", self)
+        self.adaptive_quality_checkbox.setGeometry(430, 740, 130, 30)
+        self.adaptive_quality_checkbox.setChecked(True)
+        self.adaptive_quality_checkbox.stateChanged.connect(self.set_adaptive_quality)
+        self.display_quality_label = QLabel("Display quality: full", self)
+        self.display_quality_label.setGeometry(570, 740, 300, 30)
+
+        # more cameras at once in their own window, next to the tracker camera here
+        self.multi_camera_button = QPushButton("Multi-camera", self)
+        self.multi_camera_button.setGeometry(830, 700, 120, 30)
+        self.multi_camera_button.clicked.connect(self.show_multi_camera_window)
+        self.multi_camera_window = None
+
         self.open_camera_button = QPushButton("Open camera", self)
         self.open_camera_button.setGeometry(110, 800, 150, 30)
         self.open_camera_button.setEnabled(True)
@@ -417,6 +848,79 @@ class MainApp(QMainWindow):
         self.close_camera_button.setEnabled(False)
         self.close_camera_button.clicked.connect(self.close_camera)
 
+        # record the camera frames as they come, not the downscaled display frames
+        self.full_resolution_checkbox = QCheckBox("Full resolution", self)
+        self.full_resolution_checkbox.setGeometry(910, 800, 120, 30)
+        self.full_resolution_checkbox.stateChanged.connect(self.update_pre_event_resolution)
+
+        # always-on rolling buffer, Start Recording also saves the seconds before it was clicked
+        self.pre_event_label = QLabel("Pre-event, s:", self)
+        self.pre_event_label.setGeometry(1040, 800, 80, 30)
+        self.pre_event_combobox = QComboBox(self)
+        self.pre_event_combobox.setGeometry(1120, 800, 60, 30)
+        self.pre_event_seconds = [0, 5, 10, 30]
+        self.pre_event_max_mb = 256
+        self.pre_event_buffer = None
+        self.pre_event_combobox.addItems([str(sec) if sec else "off" for sec in self.pre_event_seconds])
+        self.pre_event_combobox.currentIndexChanged.connect(self.set_pre_event_seconds)
+
+        # rolling segments instead of one file: new file every segment_minutes or segment_mb
+        self.segmented_checkbox = QCheckBox("Segments", self)
+        self.segmented_checkbox.setGeometry(1190, 800, 90, 30)
+
+        # draw track_x/track_y, the track window and the joystick cursor into the recording
+        self.overlay_checkbox = QCheckBox("Overlay", self)
+        self.overlay_checkbox.setGeometry(1280, 800, 80, 30)
+        self.overlay_checkbox.stateChanged.connect(self.set_recording_overlay)
+
+        # one folder with the video, a frame index and the serial data with arrival times
+        self.session_checkbox = QCheckBox("Session", self)
+        self.session_checkbox.setGeometry(1370, 800, 90, 30)
+        self.segment_minutes = 5
+        self.segment_mb = 500
+        self.max_segments = 24
+
+        # playback of a recorded file or session through the same display path as the camera
+        self.open_recording_button = QPushButton("Open recording", self)
+        self.open_recording_button.setGeometry(110, 870, 150, 30)
+        self.open_recording_button.clicked.connect(self.open_recording)
+        self.play_pause_button = QPushButton("Pause", self)
+        self.play_pause_button.setGeometry(270, 870, 70, 30)
+        self.play_pause_button.clicked.connect(self.play_pause)
+        self.step_back_button = QPushButton("<", self)
+        self.step_back_button.setGeometry(345, 870, 35, 30)
+        self.step_back_button.clicked.connect(lambda: self.step_playback(-1))
+        self.step_forward_button = QPushButton(">", self)
+        self.step_forward_button.setGeometry(385, 870, 35, 30)
+        self.step_forward_button.clicked.connect(lambda: self.step_playback(1))
+        self.playback_speed_combobox = QComboBox(self)
+        self.playback_speed_combobox.setGeometry(430, 870, 60, 30)
+        self.playback_speeds = [0.25, 0.5, 1, 2, 4]
+        self.playback_speed_combobox.addItems([f"{speed}x" for speed in self.playback_speeds])
+        self.playback_speed_combobox.setCurrentIndex(self.playback_speeds.index(1))
+        self.playback_speed_combobox.currentIndexChanged.connect(self.set_playback_speed)
+        self.playback_slider = QSlider(Qt.Horizontal, self)
+        self.playback_slider.setGeometry(500, 870, 500, 30)
+        self.playback_slider.sliderMoved.connect(self.scrub_playback)
+        self.playback_slider.sliderReleased.connect(self.seek_playback)
+        self.playback_position_label = QLabel("", self)
+        self.playback_position_label.setGeometry(1010, 870, 260, 30)
+        # thumbnail of the slider position while dragging, the exact frame comes on release
+        self.playback_thumbnail_label = QLabel(self)
+        self.playback_thumbnail_label.setGeometry(1280, 840, 160, 90)
+        self.playback_thumbnail_label.hide()
+        self.playback_timer = QTimer(self)
+        self.playback_timer.setInterval(200)
+        self.playback_timer.timeout.connect(self.report_playback_position)
+        self.set_playback_controls_enabled(False)
+
+        # recording is streamed to disk, this shows how it goes
+        self.recording_status_label = QLabel("", self)
+        self.recording_status_label.setGeometry(110, 835, 500, 30)
+        self.recording_status_timer = QTimer(self)
+        self.recording_status_timer.setInterval(500)
+        self.recording_status_timer.timeout.connect(self.report_recording_status)
+
         self.configurations_window_btn = QPushButton("Configurations", self)
         self.configurations_window_btn.setGeometry(1650, 250, 150, 50)
         self.configurations_window_btn.hide()
@@ -427,7 +931,6 @@ class MainApp(QMainWindow):
         # buffer for point coordinates
         self.coords_buffer = deque()
 
-        self.buffer_data = ""              # received text will be saved here
         self.buffer_deque_data = deque()   # here I append anything received - within { }, to be complete config params or coordinates
 
         self.serial_thread = None
@@ -435,9 +938,14 @@ class MainApp(QMainWindow):
         self.is_recording = False
         self.camera_closed = False
         self.input_data_json = None
-        self.recorded_frames = []
+        self.recorder = None
+        self.recorded_file = None
+        self.recordings_dir = "recordings"
+        self.session = None             # SessionWriter of the current recording
+        self.sessions_dir = "sessions"
         self.camera_buttons = []
         self.selected_camera = 0
+        self.synthetic_source_settings = (1920, 1080, 30)    # width, height, fps
         self.track_frame_size = [150, 150]  # height, width
         self.resized_frame_shape = [540, 960]   # original is- 1080 X 1920 -  frame[y][x] shape = height, width
         self.track_video = None
@@ -451,6 +959,9 @@ class MainApp(QMainWindow):
         self.cursor_y_in_original_frame = None
         self.ret = None
         self.baud_rate = 115200
+        self.serial_pacing = False      # True if the firmware loses bytes sent back to back at the full baud rate
+        self.prefer_binary_protocol = True      # binary coordinate frames if the device supports them
+        self.cursor_send_rate = 30      # cursor positions per second at most, the newest is always sent
         self.original_frame_shape = None
         self.coords_in_original_frame = None
         self.scale_x = 2  #None
@@ -566,7 +1077,19 @@ class MainApp(QMainWindow):
     def keyPressEvent(self, event):
         # H click - will apeear/disappear tracking_coord_count and temperature widgets
         # T click - mouse will go joystick/non joystck mode
-        if event.key() == Qt.Key_T:
+        # L click - show/hide latency histograms, D click - dump them to latency_histograms.txt
+        if event.key() == Qt.Key_L:
+            if self.latency_view.isVisible():
+                self.latency_view.hide()
+                self.latency_timer.stop()
+            else:
+                self.report_latency()
+                self.latency_view.show()
+                self.latency_timer.start()
+        elif event.key() == Qt.Key_D:
+            self.video_thread.latency.dump(self.latency_file)
+            print(f"latency histograms written to {self.latency_file}")
+        elif event.key() == Qt.Key_T:
             self.mouse_as_joystick = not self.mouse_as_joystick
             print("Mouse joystick mode:", self.mouse_as_joystick)
         elif event.key() == Qt.Key_H:
@@ -575,12 +1098,22 @@ class MainApp(QMainWindow):
                 self.tracking_coord_editline.show()
                 self.temperature_label.show()
                 self.temperature_line_edit.show()
+                self.capture_fps_label.show()
+                self.capture_fps_line_edit.show()
+                self.display_fps_label.show()
+                self.display_fps_line_edit.show()
+                self.fps_report_timer.start()
                 self.show_widgets = True
             else:
                 self.tracking_coord_label.hide()
                 self.tracking_coord_editline.hide()
                 self.temperature_label.hide()
                 self.temperature_line_edit.hide()
+                self.capture_fps_label.hide()
+                self.capture_fps_line_edit.hide()
+                self.display_fps_label.hide()
+                self.display_fps_line_edit.hide()
+                self.fps_report_timer.stop()
                 self.show_widgets = False
 
 
@@ -599,7 +1132,7 @@ class MainApp(QMainWindow):
             #request param
             to_json = json.dumps({"stabilization": "%"})
             self.serial_thread.send_text_signal.emit(to_json)
-            #will be refreshed in self.configs in the function - receive_data_from_serial
+            #will be refreshed in self.configs in the function - receive_serial_event
 
 
     def update_stabilization_toggle(self, state):
@@ -646,7 +1179,7 @@ class MainApp(QMainWindow):
             to_json = json.dumps({"motion_det": "%"})
             self.serial_thread.send_text_signal.emit(to_json)
             time.sleep(0.001)
-            # will be refreshed in self.configs in the function - receive_data_from_serial
+            # will be refreshed in self.configs in the function - receive_serial_event
 
 
     def update_motion_toggle(self, state):
@@ -659,11 +1192,19 @@ class MainApp(QMainWindow):
 
     def click_r_btn(self):
         #clicking R button - should send R
-        self.ser.write(bytes([0x52]))
+        self.send_to_device(bytes([0x52]))
 
     def click_w_btn(self):
         # clicking R button - should send W
-        self.ser.write(bytes([0x57]))
+        self.send_to_device(bytes([0x57]))
+
+    def send_to_device(self, data):
+        # one transmit path - through the serial thread's SerialWriter, same lock and queue as the
+        # coordinates and the configurations window. the direct write is only for a port without the thread
+        if self.serial_thread is not None:
+            self.serial_thread.writer.send(data)
+        elif self.ser is not None and self.ser.is_open:
+            write_message(self.ser, data, framed=False)
 
 
     def mousePressEvent(self, event):
@@ -693,9 +1234,7 @@ class MainApp(QMainWindow):
         pointer_x, pointer_y  = self.update_joystick_pointer(dx, dy)
         if self.serial_thread:
             print("latest coordinate is sent")
-            x_json = json.dumps(pointer_x)
-            y_json = json.dumps(pointer_y)
-            self.serial_thread.send_joystick_coordinates.emit(x_json, y_json)
+            self.serial_thread.send_cursor_signal.emit(pointer_x['cursor_x'], pointer_y['cursor_y'])
 
 
     def start_joystick_motion(self):
@@ -737,6 +1276,8 @@ class MainApp(QMainWindow):
                               'cursor_y': int(((self.pointer_pos[1] + 5) * self.scale_y))}
 
         self.pointers_buffer.append(self.pointer_coord)
+        if self.video_thread:
+            self.video_thread.overlay.set_cursor(self.pointer_coord['cursor_x'], self.pointer_coord['cursor_y'])
 
         return pointer_x, pointer_y
 
@@ -750,10 +1291,8 @@ class MainApp(QMainWindow):
         x = pointer_x['cursor_x']
         y = pointer_y['cursor_y']
         if self.serial_thread:
-            x_json = json.dumps(pointer_x)
-            y_json = json.dumps(pointer_y)
             if not self.joystick_stopped:
-                self.serial_thread.send_joystick_coordinates_with_interval.emit(x_json, y_json)
+                self.serial_thread.send_cursor_signal.emit(x, y)
                 if self.configs_window:
                     self.configs_window.change_parameter_value(x, "cursor_x")
                     self.configs_window.change_parameter_value(y, "cursor_y")
@@ -804,16 +1343,21 @@ class MainApp(QMainWindow):
 
 
     def update_cameras_widget(self):
-        if len(self.available_cameras) != 0:
-            self.cameras_combobox.clear()
-            for i in range(len(self.available_cameras)):
-                self.cameras_combobox.addItem(f"Camera {self.available_cameras[i][0]}")
-            self.cameras_combobox.setCurrentIndex(0)
+        # the last item is the generated test source, it is there also without cameras
+        self.cameras_combobox.clear()
+        for i in range(len(self.available_cameras)):
+            self.cameras_combobox.addItem(f"Camera {self.available_cameras[i][0]}")
+        width, height, fps = self.synthetic_source_settings
+        self.cameras_combobox.addItem(f"Synthetic {width}x{height} @{fps}")
+        self.cameras_combobox.setCurrentIndex(0)
 
 
     def select_camera(self, ind):
+        if ind < 0:
+            return      # the combobox is being refilled
         self.selected_camera = ind
-        print(self.available_cameras[self.selected_camera])
+        if ind < len(self.available_cameras):
+            print(self.available_cameras[self.selected_camera])
         self.open_camera_button.setEnabled(True)
 
 
@@ -829,45 +1373,279 @@ class MainApp(QMainWindow):
 
         print("self.video_thread", self.video_thread)
 
-        if self.video_thread is not None:  # and self.video_thread.get_index() != self.available_cameras[self.selected_camera][1]:
-            self.video_thread.stop()
-            self.video_thread = None
         if self.video_label:
             self.video_label.clear()
         if self.track_video_label:
             self.track_video_label.clear()
 
-        ind = self.available_cameras[self.selected_camera][1]
-        api_pref = self.available_cameras[self.selected_camera][2]
+        # the running thread releases the previous camera (or playback) and opens this one
+        if self.selected_camera >= len(self.available_cameras):
+            # moving targets instead of a camera - for trying the pipeline without hardware
+            width, height, fps = self.synthetic_source_settings
+            spec = ("synthetic", {"width": width, "height": height, "fps": fps})
+        else:
+            ind = self.available_cameras[self.selected_camera][1]
+            api_pref = self.available_cameras[self.selected_camera][2]
+            spec = ("camera", ind, api_pref)
+        if self.process_capture_checkbox.isChecked():
+            self.video_thread.open_process_capture(spec)
+        elif spec[0] == "synthetic":
+            self.video_thread.open_source(SyntheticSource(**spec[1]))
+        else:
+            self.video_thread.open_camera(spec[1], spec[2])
+        self.reset_display_quality()
+        self.render_timer.start()
+        self.playback_timer.stop()
+        self.set_playback_controls_enabled(False)
+
+
+    def open_recording(self):
+        # a video file, or session.json of a session folder - then the logged coordinates are shown too
+        filename, _ = QFileDialog.getOpenFileName(self, "Open Recording", self.recordings_dir,
+                                                  "Recordings (*.mp4 *.avi session.json);;All Files (*)")
+        if not filename:
+            return
+        if os.path.basename(filename) == "session.json":
+            filename = os.path.dirname(filename)
+        if self.is_recording:
+            self.stop_recording()
+        self.camera_closed = False
+        self.close_camera_button.setEnabled(True)
+        self.start_button.setEnabled(False)
+        self.video_thread.open_file(filename)
+        self.reset_display_quality()
+        self.render_timer.start()
+        self.playback_timer.start()
+        self.play_pause_button.setText("Pause")
+        self.playback_speed_combobox.setCurrentIndex(self.playback_speeds.index(1))
+        self.set_playback_controls_enabled(True)
+
+
+    def set_playback_controls_enabled(self, enabled):
+        for widget in (self.play_pause_button, self.step_back_button, self.step_forward_button,
+                       self.playback_speed_combobox, self.playback_slider):
+            widget.setEnabled(enabled)
+        if not enabled:
+            self.playback_position_label.setText("")
+            self.playback_thumbnail_label.hide()
+
+
+    def play_pause(self):
+        playback = self.video_thread.playback
+        if playback is None:
+            return
+        if playback.paused:
+            playback.resume()
+            self.play_pause_button.setText("Pause")
+        else:
+            playback.pause()
+            self.play_pause_button.setText("Play")
 
-        self.video_thread = VideoCaptureThread(index=ind, api_pref=api_pref, default_frame=None)
 
-        self.video_thread.camera_ready_signal.connect(self.hide_loading)
-        self.video_thread.change_frame_signal.connect(self.update_frame)
+    def step_playback(self, frames):
+        playback = self.video_thread.playback
+        if playback is not None:
+            playback.step(frames)
+            self.play_pause_button.setText("Play")
 
-        self.video_thread.start()
+
+    def set_playback_speed(self, ind):
+        playback = self.video_thread.playback
+        if playback is not None:
+            playback.set_speed(self.playback_speeds[ind])
+
+
+    def scrub_playback(self, frame):
+        # only the thumbnail while dragging, decoding every slider position would lag behind
+        playback = self.video_thread.playback
+        if playback is None:
+            return
+        thumbnail = playback.thumbnail_for(frame)
+        if thumbnail is not None:
+            rgb = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2RGB)
+            self.playback_thumbnail_label.setPixmap(QtGui.QPixmap.fromImage(rgb_to_qimage(rgb)))
+            self.playback_thumbnail_label.show()
+        self.playback_position_label.setText(f"frame {frame} / {playback.frame_count}")
+
+
+    def seek_playback(self):
+        playback = self.video_thread.playback
+        self.playback_thumbnail_label.hide()
+        if playback is not None:
+            playback.seek(self.playback_slider.value())
+
+
+    def report_playback_position(self):
+        playback = self.video_thread.playback
+        if playback is None:
+            return
+        if self.playback_slider.maximum() != max(0, playback.frame_count - 1):
+            self.playback_slider.setMaximum(max(0, playback.frame_count - 1))
+        if self.playback_slider.isSliderDown():
+            return
+        self.playback_slider.setValue(max(0, playback.current))
+        text = f"frame {max(0, playback.current)} / {playback.frame_count}, " \
+               f"{max(0, playback.current) / playback.fps:.1f} s"
+        tracking = playback.current_tracking
+        if tracking is not None:
+            text += f", track {tracking.track_x:.0f}, {tracking.track_y:.0f}"
+        self.playback_position_label.setText(text)
+        self.play_pause_button.setText("Play" if playback.paused else "Pause")
+
+
+    def show_multi_camera_window(self):
+        # the camera list is taken when the window is made, the camera open here isn't offered
+        if self.multi_camera_window is None:
+            sources = [(f"Camera {name}", ("camera", index, backend))
+                       for name, index, backend in self.available_cameras
+                       if index != self.video_thread.get_index()]
+            width, height, fps = self.synthetic_source_settings
+            sources += [(f"Synthetic {i + 1}", ("synthetic", {"width": width, "height": height, "fps": fps, "seed": i}))
+                        for i in range(3)]
+            self.multi_camera_window = MultiCameraWindow(sources, display_fps=self.display_fps)
+        self.multi_camera_window.show()
+        self.multi_camera_window.raise_()
+
+
+    def show_placeholder(self):
+        self.video_label.setPixmap(self.gray_pixmap)
+        self.drop_displayed_frame()
+        self.track_video = None
+        self.track_video_label.clear()
+
+
+    def set_display_fps(self, fps):
+        self.display_fps = fps
+        self.render_timer.setInterval(int(1000 / fps))
+        self.display_fps_counter.reset()
+        self.apply_display_quality()
+
+
+    def set_adaptive_quality(self, state):
+        # off - back to the full quality on the next render tick
+        self.video_thread.display_quality.enabled = bool(state)
+
+
+    def reset_display_quality(self):
+        self.video_thread.display_quality.reset()
+        self.last_render_tick = None
+        self.painted_frames = 0
+        self.apply_display_quality()
 
 
-    @pyqtSlot(np.ndarray)
-    def update_frame(self, frame):
-        if self.port_connected and self.video_thread is not None:
-            self.original_frame_shape = frame.shape  # height-Y, width-X, ch - BGR
-            frame = cv2.resize(frame, (self.resized_frame_shape[1], self.resized_frame_shape[0]))  #dsize = (new_width, new_height)
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                                                #     w                h
-            img = QtGui.QImage(frame.tobytes(), frame.shape[1], frame.shape[0], frame.shape[1] * frame.shape[2],
-                               QtGui.QImage.Format_RGB888)
-            self.video_label.setPixmap(QtGui.QPixmap.fromImage(img))
+    def apply_display_quality(self):
+        quality = self.video_thread.display_quality
+        interpolation, paint_every = quality.get_settings()
+        self.video_thread.preparer.set_quality(interpolation)
+        # the low latency mode decodes only the frames that will be painted
+        self.video_thread.display_interval = paint_every / self.display_fps
+        self.display_quality_label.setText(f"Display quality: {quality.get_name()}")
+
+
+    def set_low_latency(self, state):
+        # latency histograms start again, so the two modes can be compared
+        self.video_thread.set_low_latency(bool(state))
+        self.video_thread.latency.reset()
+
+
+    def report_latency(self):
+        text = self.video_thread.latency.to_text()
+        quality = self.video_thread.display_quality
+        text = f"display quality: {quality.get_name()}, load {quality.get_load(1 / self.display_fps):.0%}, " \
+               f"{quality.changes} changes\n" + text
+        if self.displayed_frame is not None:
+            # a load test (synthetic source, no device) compares the painted frames with the produced ones
+            text = f"frame #{self.displayed_frame.seq}, painted {self.painted_frames}, " \
+                   f"dropped {self.get_dropped_frames()}\n" + text
+        process_capture = self.video_thread.process_capture
+        if process_capture is not None:
+            stats = process_capture.get_stats()
+            text = f"capture process: frames {stats['frames']}, dropped in the child {stats['child_dropped']}, " \
+                   f"restarts {stats['restarts']}\n" + text
+        if self.serial_thread:
+            cursor = self.serial_thread.cursor_queue.get_stats()
+            text = f"cursor: sent {cursor['sent']}, coalesced {cursor['coalesced']}; tracking coordinates " \
+                   f"coalesced {self.serial_thread.coalesced_coords}\n" + text
+        if self.video_thread.low_latency:
+            text = f"low latency: stale {self.video_thread.stale_frames}, " \
+                   f"not decoded {self.video_thread.undecoded_frames}\n" + text
+        self.latency_view.setPlainText(text)
+
+
+    def report_fps(self):
+        capture_fps = self.video_thread.get_capture_fps() if self.video_thread else 0
+        self.capture_fps_line_edit.setText(f"{capture_fps:.0f}")
+        self.display_fps_line_edit.setText(f"{self.display_fps_counter.get_fps():.0f}")
+
+
+    def render_latest_frame(self):
+        # render timer tick - always the newest frame, the older ones were already dropped by the buffer
+        if self.video_thread is None or self.camera_closed:
+            self.last_render_tick = None
+            return
+        now = time.perf_counter()
+        interval = self.render_timer.interval() / 1000
+        quality = self.video_thread.display_quality
+        if self.last_render_tick is not None:
+            quality.record_late(now - self.last_render_tick - interval)
+        self.last_render_tick = now
+        if quality.update(now, interval):
+            self.apply_display_quality()
+        # at the reduced rates some ticks skip the video, the track window below still follows
+        frame = self.video_thread.frame_buffer.take() if quality.paint_due() else None
+        if frame is not None:
+            latency = self.video_thread.latency
+            paint_start = time.perf_counter()
+            latency.record("queue", paint_start - frame.prepared_time)
+            self.displayed_frame = frame
+            if self.update_frame(frame):
+                # only frames that made it to the screen count
+                paint_end = time.perf_counter()
+                latency.record("paint", paint_end - paint_start)
+                quality.record_paint(paint_end - paint_start)
+                latency.record("total", paint_end - frame.capture_time)
+                self.display_fps_counter.tick(paint_end)
+                self.painted_frames += 1
+        elif self.displayed_frame is not None and self.port_connected:
+            # no new frame from a slow camera - still follow the track window moves
+            track_window = self.video_thread.preparer.get_track_window()
+            if track_window != self.displayed_track_window:
+                self.video_thread.preparer.crop_track_window(self.displayed_frame)
+                self.show_track_video(self.displayed_frame)
+
+
+    def drop_displayed_frame(self):
+        # the frame's slot goes back to the capture thread only when it is off the screen
+        self.displayed_frame = None
+        if self.video_thread is not None:
+            self.video_thread.frame_buffer.release_taken()
+
+
+    def get_dropped_frames(self):
+        if self.video_thread is None:
+            return 0
+        return self.video_thread.get_dropped_frames()
+
+
+    def update_frame(self, prepared) -> bool:
+        # prepared - PreparedFrame from the capture thread, already resized and in RGB.
+        # True when the frame was painted. the video is painted without a device too (playback,
+        # synthetic source), only the sync with the device's configs needs the port
+        if self.video_thread is None:
+            return False
+        self.original_frame_shape = prepared.original_shape  # height-Y, width-X, ch - BGR
+        frame = prepared.display
+        # QImage over the frame memory, fromImage copies it into the pixmap right away
+        self.video_label.setPixmap(QtGui.QPixmap.fromImage(rgb_to_qimage(frame)))
 
+        if self.port_connected:
             self.scale_x = self.original_frame_shape[1] / self.resized_frame_shape[1]  # width,   becuase frame_shape[1]=width
             self.scale_y = self.original_frame_shape[0] / self.resized_frame_shape[0]  # height           frame_shape[0]=height
-            x = 0
-            y = 0
             try:
                 if self.configs_window and len(self.configs) > 2:
                     #print(f"self.configs- {self.configs}")
-                    x = self.configs['track_x'] / self.scale_x
-                    y = self.configs['track_y'] / self.scale_y
+                    self.video_thread.preparer.set_track_window(self.configs['track_x'], self.configs['track_y'],
+                                                                self.configs['track_wndw_size'])
 
                     ui_stab_state = self.stabilization_toggle.isChecked()
                     configs_stab = self.configs['stabilization']
@@ -889,78 +1667,203 @@ class MainApp(QMainWindow):
                         self.update_motion_toggle(motion_track)
             except Exception as e:
                 print("Unexpected error:", e)
-                return
+                return True
                 #QMessageBox.critical(self, "Error", "Invalid response from device.")
                 #if self.ser and self.ser.is_open:
                 #    self.ser.close()
 
-            if self.configs and x and y:
-                track_windw_size = self.configs['track_wndw_size']
-                self.track_frame_size = [track_windw_size, track_windw_size]
+        self.show_track_video(prepared)
 
-                x_start = int(max(0, int(x- track_windw_size/4)))
-                x_end = int(
-                    min(self.resized_frame_shape[1], int(x + 3/4*track_windw_size  )))
-                y_start = int(max(0, int(y- track_windw_size/4)))
-                y_end = int(
-                    min(self.resized_frame_shape[0], int(y + 3/4*track_windw_size)))
-
-                self.track_video = frame[y_start:y_end, x_start:x_end]
-
-                if self.track_video.size > 0:
-                    h, w, ch = self.track_video.shape
-                    bytes_per_line = ch * w
-                    self.track_video_label.setPixmap(QtGui.QPixmap.fromImage(QtGui.QImage(self.track_video.tobytes(),
-                                                                                          w, h, bytes_per_line,
-                                                                                          QtGui.QImage.Format_RGB888)))
-                    self.track_video_label.setGeometry(self.track_video_label_x, self.track_video_label_y,
-                                                       track_windw_size, track_windw_size)  # x, y, w, h
-            if self.track_frame_size == [0, 0] and self.track_video_label is not None:
-                self.track_video_label.clear()
+        self.current_frame = frame
+        return True
 
-            if self.is_recording:
-                self.recorded_frames.append(frame)
-            self.current_frame = frame
 
+    def show_track_video(self, prepared):
+        self.displayed_track_window = self.video_thread.preparer.get_track_window()
+        if prepared.track is not None:
+            track_windw_size = prepared.track_size
+            self.track_frame_size = [track_windw_size, track_windw_size]
+            self.track_video = prepared.track
+            self.track_video_label.setPixmap(QtGui.QPixmap.fromImage(rgb_to_qimage(self.track_video)))
+            self.track_video_label.setGeometry(self.track_video_label_x, self.track_video_label_y,
+                                               track_windw_size, track_windw_size)  # x, y, w, h
+        if self.track_frame_size == [0, 0] and self.track_video_label is not None:
+            self.track_video_label.clear()
 
 
     def start_recording(self):
-        self.recorded_frames = []
+        # frames are encoded to a temporary file while recording, Save moves it where the user wants
+        self.discard_recording()
+        # the recorder measures the real fps from the capture timestamps, this is only the fallback
+        fps = self.video_thread.get_fps() or 30
+        # the pre-event frames (if any) are written first, then the live stream
+        options = {"pre_event": self.pre_event_buffer}
+        filename = make_recording_filename(self.recordings_dir)
+        if self.segmented_checkbox.isChecked():
+            # long unattended runs - files roll over by time/size and stay in recordings_dir,
+            # only the newest max_segments are kept
+            filename = make_recording_filename(self.recordings_dir, index=1)
+            options.update(segment_seconds=self.segment_minutes * 60, segment_bytes=self.segment_mb * 1024 * 1024,
+                           max_segments=self.max_segments)
+        options["burn_overlay"] = self.overlay_checkbox.isChecked()
+        if self.session_checkbox.isChecked():
+            # video, frame index and serial data in one folder, on one clock.
+            # the recorder closes the session when its last frame is written
+            self.session = SessionWriter(make_session_folder(self.sessions_dir))
+            filename = make_recording_filename(self.session.folder, index=1)
+            options["session"] = self.session
+            if self.displayed_frame is not None:
+                # the tracking coordinates are in the camera frame, also when the video is downscaled
+                self.session.set_source_size(self.displayed_frame.original_shape[1],
+                                             self.displayed_frame.original_shape[0])
+        if self.full_resolution_checkbox.isChecked():
+            # camera frames before any display processing, the size comes from the first frame.
+            # smaller queue - a 1080p frame is ~6 MB
+            self.recorder = VideoRecorder(filename=filename, fps=fps, queue_size=30, full_resolution=True, **options)
+        else:
+            height, width = self.resized_frame_shape
+            self.recorder = VideoRecorder(filename=filename, fps=fps, frame_size=(width, height), **options)
+        # the capture thread switches from the pre-event buffer to the recorder before the recorder
+        # flushes that buffer, so no frame falls in between
+        self.video_thread.recorder = self.recorder
+        if not self.recorder.start():
+            self.video_thread.recorder = None
+            QMessageBox.warning(self, "Error", self.recorder.error)
+            self.recorder = None
+            self.detach_session()
+            return
+        if self.session is not None and self.serial_thread:
+            self.serial_thread.session = self.session
+        # segments and sessions are the final files, there is nothing to save or discard
+        self.recorded_file = None if self.recorder.is_segmented() or self.session else self.recorder.filename
+        self.recording_status_timer.start()
+
         self.is_recording = True
         self.open_camera_button.setEnabled(False)
         self.start_button.setEnabled(False)
         self.stop_button.setEnabled(True)
         self.save_records_button.setEnabled(False)
+        self.full_resolution_checkbox.setEnabled(False)
+        self.pre_event_combobox.setEnabled(False)
+        self.segmented_checkbox.setEnabled(False)
+        self.overlay_checkbox.setEnabled(False)
+        self.session_checkbox.setEnabled(False)
 
 
     def stop_recording(self):
         self.is_recording = False
+        if self.video_thread:
+            self.video_thread.recorder = None
+        if self.recorder:
+            self.recorder.stop()      # queued frames are still written, save_video waits for them
+        self.detach_session()
         self.start_button.setEnabled(True)
         self.stop_button.setEnabled(False)
-        self.save_records_button.setEnabled(True)
+        self.save_records_button.setEnabled(self.recorded_file is not None)
         self.open_camera_button.setEnabled(True)
+        self.full_resolution_checkbox.setEnabled(True)
+        self.pre_event_combobox.setEnabled(True)
+        self.segmented_checkbox.setEnabled(True)
+        self.overlay_checkbox.setEnabled(True)
+        self.session_checkbox.setEnabled(True)
+
+
+    def detach_session(self):
+        # no more serial data for the session, the recorder closes it after the last frame
+        if self.serial_thread:
+            self.serial_thread.session = None
+        if self.session is not None and (self.recorder is None or not self.recorder.is_running()):
+            self.session.close()
+        self.session = None
+
+
+    def set_pre_event_seconds(self, ind):
+        # 0 - off. the buffer is recreated, so the frames kept so far are lost
+        seconds = self.pre_event_seconds[ind]
+        if self.pre_event_buffer is not None:
+            self.video_thread.pre_event_buffer = None
+            self.pre_event_buffer.stop()
+            self.pre_event_buffer = None
+        if seconds:
+            self.pre_event_buffer = PreEventBuffer(seconds=seconds, max_bytes=self.pre_event_max_mb * 1024 * 1024)
+            self.update_pre_event_resolution()
+            self.video_thread.pre_event_buffer = self.pre_event_buffer
+
+
+    def set_recording_overlay(self, state):
+        # snapshots are taken also for the pre-event buffer, so it is switched on right away
+        self.video_thread.overlay.enabled = bool(state)
+
+
+    def update_pre_event_resolution(self):
+        # the rolling buffer keeps frames in the size the next recording will have
+        if self.pre_event_buffer is not None:
+            self.pre_event_buffer.clear()
+        self.video_thread.pre_event_full_resolution = self.full_resolution_checkbox.isChecked()
+
+
+    def report_recording_status(self):
+        if self.recorder is None:
+            self.recording_status_timer.stop()
+            return
+        if self.recorder.error and self.is_recording:
+            # the worker has stopped - the writer couldn't be opened or written
+            error = self.recorder.error
+            self.stop_recording()
+            if self.recorded_file and not os.path.exists(self.recorded_file):
+                self.recorded_file = None
+                self.save_records_button.setEnabled(False)
+            QMessageBox.warning(self, "Error", error)
+        stats = self.recorder.get_stats()
+        text = f"Recorded: {stats['written']} frames at {stats['fps']:.1f} fps, " \
+               f"queue {stats['queued']}/{stats['capacity']}, dropped {stats['dropped']}, " \
+               f"duplicated {stats['duplicated']}, encoder {stats['encode_fps']:.0f} fps"
+        if self.recorder.pre_event_frames:
+            text += f", pre-event {self.recorder.pre_event_frames}"
+        if stats['staging_dropped']:
+            text += f", lost while writing the pre-event {stats['staging_dropped']}"
+        if self.recorder.is_segmented():
+            text += f", segment {self.recorder.segment_count} ({stats['segments']} kept)"
+        if stats['queued'] > stats['capacity'] * 0.75:
+            text += " - encoder can't keep up!"
+        self.recording_status_label.setText(text)
+        if not self.is_recording and not self.recorder.is_running():
+            self.recording_status_timer.stop()
+
+
+    def discard_recording(self):
+        # the temporary file of a recording that was not saved, segments are kept
+        if self.recorder:
+            if self.video_thread:
+                self.video_thread.recorder = None
+            self.recorder.stop()
+            self.recorder.join()
+            self.recorder = None
+        self.detach_session()
+        if self.recorded_file:
+            for path in (self.recorded_file, self.recorded_file + ".timestamps.csv"):
+                if os.path.exists(path):
+                    os.remove(path)
+        self.recorded_file = None
+        self.recording_status_label.setText("")
 
 
     def save_video(self):
         print("save recorded video")
-        if len(self.recorded_frames) == 0:
+        if self.recorder is None or not self.recorded_file:
             return
 
-        # get the FPS from camera
-        fps = self.video_thread.video_capture.get(cv2.CAP_PROP_FPS)  # 30 ??
-        print(f"fps of the camera - {fps}")
-
         filename, _ = QFileDialog.getSaveFileName(self, "Save Video", "", "mp4 Files (*.mp4v)")   # (*.mp4v)
         if filename:
-            fshape = self.recorded_frames[0].shape
-            fheight = int(fshape[0])
-            fwidth = int(fshape[1])
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')        # (*.mp4v)
-            self.video_writer = cv2.VideoWriter(filename=filename, fourcc=fourcc, fps=5, frameSize=(fwidth, fheight), isColor=True)
-            for frame in self.recorded_frames:
-                self.video_writer.write(frame)
-            self.video_writer.release()
-            self.recorded_frames = []
+            self.recorder.join()       # the rest of the queue is written
+            self.report_recording_status()
+            shutil.move(self.recorded_file, filename)
+            # per-frame capture times, to line the video up with the coordinate logs
+            if os.path.exists(self.recorder.sidecar_filename):
+                shutil.move(self.recorder.sidecar_filename, filename + ".timestamps.csv")
+            self.recorded_file = None
+            self.recorder = None
+            self.save_records_button.setEnabled(False)
 
         print("video saved!")
 
@@ -1018,7 +1921,7 @@ class MainApp(QMainWindow):
     def connect_port(self):
         if self.port_connected and self.ser is not None and self.ser.is_open:
             # send 'D' - Disconnect
-            self.ser.write(bytes([0x44]))
+            self.send_to_device(bytes([0x44]))
             time.sleep(0.3)
             if self.configs_window:
                 self.configs_window.hide()                                   # self.console.configs_window.timer.stop()
@@ -1106,8 +2009,14 @@ class MainApp(QMainWindow):
                         if "Connected" in confirmation or "connected" in confirmation.lower():
                             self.connect_btn.setText("Disconnect")
                             self.port_connected = True
-                            self.serial_thread = SerialThread(self.ser)
-                            self.serial_thread.received_data_signal.connect(self.receive_data_from_serial)
+                            # before the thread reads - the answer is read here
+                            binary = self.prefer_binary_protocol and negotiate(self.ser)
+                            print("coordinate protocol:", "binary" if binary else "JSON")
+                            self.serial_thread = SerialThread(self.ser, pace=self.serial_pacing, binary=binary,
+                                                              cursor_rate=self.cursor_send_rate)
+                            self.serial_thread.session = self.session
+                            self.serial_thread.event_signal.connect(self.receive_serial_event)
+                            self.serial_thread.tracking_coords_signal.connect(self.receive_tracking_coords)
                             self.serial_thread.start()
                             time.sleep(0.1)
 
@@ -1132,94 +2041,73 @@ class MainApp(QMainWindow):
                     self.ser.close()
 
 
-    def receive_data_from_serial(self, text):
-        if self.first_log:
-            clear_log(filename = self.log_file)
-            clear_log(filename = self.coordinates_log_file)
-            self.first_log = False
-        #write_log(text=text, filename = self.log_file)
-        self.buffer_log += text
-        if "Disconnected" in text:
-            self.disconnect()
-
-        self.buffer_data += text
-        print("buffer: ", self.buffer_data)
-
-        if "{" in self.buffer_data and "}" in self.buffer_data and '[Config]' in self.buffer_data:
-            st = self.buffer_data.index('{')
-            end = self.buffer_data.index('}') + 1
-            t = self.buffer_data[st:end]
-
-            self.configs = json.loads(t)
-            configs_for_win = copy.copy(self.configs)
-            if self.buffer_data.index('[Config]') < st:
-                if 'tracking' in configs_for_win:
-                    del configs_for_win['tracking']
-                if 'stabilization' in configs_for_win:
-                    del configs_for_win['stabilization']
-                if 'motion_det' in configs_for_win:
-                    del configs_for_win['motion_det']
-                if 'temperature' in configs_for_win:
-                    tmp = round(configs_for_win['temperature'])
-                    self.temperature_line_edit.setText(str(tmp))
-                    del configs_for_win['temperature']
-                if self.configs_window is None:
-                    self.configurations_window_btn.show()
-                    self.configs_window = ConfigurationsWindow(configs_dict=configs_for_win, ser_th=self.serial_thread)
-                    self.configs_window.show()
-                    self.stabilization_label.show()
-
-                    self.stabilization_toggle.show()
-                    self.tracking_label.show()
-                    self.tracking_toggle.show()
-                    self.motion_label.show()
-                    self.motion_toggle.show()
-                    self.configs_window.show()
-                    self.track_video_label.show()
-                    self.temperature_timer.start()
-                else:
-                    json_string = json.dumps(configs_for_win)
-                    self.configs_window.fill_get_fields(json_string)
-
-                self.buffer_data = self.buffer_data.replace(t, "")
-                self.buffer_data = self.buffer_data.replace("[Config]", "")
-                self.buffer_data = self.buffer_data.replace(']', "")
-
-        while '{' in self.buffer_data and '}' in self.buffer_data:
-            ind1 = self.buffer_data.index('{')
-            ind2 = self.buffer_data.index('}') + 1
-            sub_text = self.buffer_data[ind1: ind2]
-            try:
-                sub_text_dict = json.loads(sub_text)
-                if list(sub_text_dict.keys()) == ['track_x', 'track_y']:
-                    self.tracking_coord_count += 1
-                    x = sub_text_dict['track_x']
-                    y = sub_text_dict['track_y']
-                    self.configs['track_x'] = x
-                    self.configs['track_y'] = y
-                    self.coordinates_log += f"{x}   {y}\n"
-
-                if 'tracking' in sub_text_dict:
-                    self.configs['tracking'] = sub_text_dict['tracking']
-                elif 'stabilization' in sub_text_dict:
-                    self.configs['stabilization'] = sub_text_dict['stabilization']
-                elif 'motion_det' in sub_text_dict:
-                    self.configs['motion_det'] = sub_text_dict['motion_det']
-                elif 'temperature' in sub_text_dict:
-                    tmp = round(sub_text_dict['temperature'])
-                    self.configs['temperature'] = tmp
-                    self.temperature_line_edit.setText(str(tmp))
-                else:
-                    self.configs_window.fill_get_fields(sub_text)
+    def receive_serial_event(self, kind, payload, arrival_time):
+        # decoded by the serial thread, tracking coordinates come through receive_tracking_coords
+        try:
+            if kind == CONFIG:
+                self.receive_configs(payload)
+            elif kind == STATUS:
+                name, value = payload
+                self.configs[name] = value
+            elif kind == TEMPERATURE:
+                self.configs['temperature'] = payload
+                self.temperature_line_edit.setText(str(payload))
+            elif kind == PARAMETER:
+                if self.configs_window is not None:
+                    self.configs_window.fill_get_fields(payload)
+            elif kind == DISCONNECTED:
+                self.disconnect()
+        except Exception as e:
+            print(f"Error: {kind} {payload} - {e}")
+
+
+    def receive_configs(self, configs):
+        # [Config] snapshot - all parameters of the device
+        self.configs = configs
+        configs_for_win = copy.copy(self.configs)
+        if 'tracking' in configs_for_win:
+            del configs_for_win['tracking']
+        if 'stabilization' in configs_for_win:
+            del configs_for_win['stabilization']
+        if 'motion_det' in configs_for_win:
+            del configs_for_win['motion_det']
+        if 'temperature' in configs_for_win:
+            tmp = round(configs_for_win['temperature'])
+            self.temperature_line_edit.setText(str(tmp))
+            del configs_for_win['temperature']
+        if self.configs_window is None:
+            self.configurations_window_btn.show()
+            self.configs_window = ConfigurationsWindow(configs_dict=configs_for_win, ser_th=self.serial_thread)
+            self.configs_window.show()
+            self.stabilization_label.show()
+
+            self.stabilization_toggle.show()
+            self.tracking_label.show()
+            self.tracking_toggle.show()
+            self.motion_label.show()
+            self.motion_toggle.show()
+            self.configs_window.show()
+            self.track_video_label.show()
+            self.temperature_timer.start()
+        else:
+            json_string = json.dumps(configs_for_win)
+            self.configs_window.fill_get_fields(json_string)
 
-                self.buffer_data = self.buffer_data.replace(sub_text, "")
 
-            except json.decoder.JSONDecodeError as e:
-                print(f"json decoding error: {sub_text}")
-                return
-            except Exception as e:
-                print(f"Error: {sub_text}")
-                return
+    def receive_tracking_coords(self):
+        # all the coordinates since the last call, the newest one is the track window position
+        if self.serial_thread is None:
+            return
+        coords = self.serial_thread.take_tracking_coords()
+        if not coords:
+            return
+        self.tracking_coord_count += len(coords)
+        self.coordinates_log += "".join(f"{x}   {y}\n" for x, y, _ in coords)
+        x, y, _ = coords[-1]
+        self.configs['track_x'] = x
+        self.configs['track_y'] = y
+        if self.configs_window is not None:
+            self.configs_window.fill_get_fields({'track_x': x, 'track_y': y})
 
 
     def disconnect(self):
@@ -1237,6 +2125,8 @@ class MainApp(QMainWindow):
         self.motion_label.hide()
         self.motion_toggle.hide()
         self.track_video_label.hide()
+        if self.video_thread:
+            self.video_thread.preparer.clear_track_window()
         if self.temperature_timer.isActive():
             self.temperature_timer.stop()
         self.temperature_line_edit.setText('0')
@@ -1244,7 +2134,6 @@ class MainApp(QMainWindow):
             self.receiving_tracking_coord_timer.stop()
         self.tracking_coord_editline.setText('0')
         self.flush_logs()
-        self.buffer_data = ''
         f = open(self.log_file, 'a')
         f.close()
         fl = open(self.coordinates_log_file, "a")
@@ -1262,6 +2151,13 @@ class MainApp(QMainWindow):
 
     def flush_logs(self):
         print("flush_logs")
+        if self.serial_thread:
+            self.buffer_log += self.serial_thread.take_log()
+        # the first serial data of any kind - the logs of the previous run are cleared
+        if self.first_log and (self.buffer_log or self.coordinates_log):
+            clear_log(filename = self.log_file)
+            clear_log(filename = self.coordinates_log_file)
+            self.first_log = False
         if self.buffer_log:
             try:
                 f = open(self.log_file, 'a')
@@ -1329,7 +2225,7 @@ class MainApp(QMainWindow):
             self.configs_window.track_coord_x = self.configs_window.buffer_configs["track_x"]
             self.configs_window.track_coord_y = self.configs_window.buffer_configs["track_y"]
         else:
-            write_to_serial(self.ser, coords_to_json)
+            self.send_to_device(coords_to_json)
 
 
     def show_configurations(self):
@@ -1343,14 +2239,17 @@ class MainApp(QMainWindow):
     def close_camera(self):
         self.camera_closed = True
         self.is_recording = False
+        self.render_timer.stop()
+        self.playback_timer.stop()
+        self.set_playback_controls_enabled(False)
+        self.drop_displayed_frame()
         if self.video_thread:
-            self.video_thread.stop()
-            self.video_thread = None
+            self.video_thread.close_camera()     # thread goes idle, it is stopped in closeEvent
         self.video_label.clear()
         self.video_label.setPixmap(self.gray_pixmap)
         self.track_video = None
         self.track_video_label.clear()
-        self.recorded_frames = []
+        self.discard_recording()
         self.close_camera_button.setEnabled(False)
         self.open_camera_button.setEnabled(True)
         self.save_records_button.setEnabled(False)
@@ -1370,6 +2269,14 @@ class MainApp(QMainWindow):
         if self.is_recording:
             self.stop_recording()
         self.close_camera()
+        if self.pre_event_buffer:
+            self.pre_event_buffer.stop()
+        if self.multi_camera_window:
+            self.multi_camera_window.shutdown()
+            self.multi_camera_window.close()
+        if self.video_thread:
+            self.video_thread.stop()
+            self.video_thread = None
         if self.configs_window:
             self.configs_window.close()
 
@@ -1390,6 +2297,121 @@ def the_closest_string(s: str, list_of_strings: list):
 
 
 
+class MultiCameraWindow(QWidget):
+    # several cameras at once in a grid, e.g. the tracker camera and a wide-angle context camera.
+    # one CaptureScheduler does the capture and preparation of all streams, one render timer paints
+    # the newest frame of every stream, so the window costs the GUI thread only the pixmap copies.
+    # sources - [(name, spec)] with specs for frame_sources.make_source
+    def __init__(self, sources, cell_size=(640, 360), display_fps=30, workers=2):
+        super().__init__()
+        self.setWindowTitle("Multi-camera view")
+        self.sources = sources
+        self.cell_width, self.cell_height = cell_size
+        self.scheduler = CaptureScheduler(workers=workers)
+        self.streams = []
+        self.cells = []             # (video label, stats label) per stream
+
+        self.source_checkboxes = []
+        for i, (name, _) in enumerate(sources):
+            checkbox = QCheckBox(name, self)
+            checkbox.setGeometry(10 + (i % 4) * 200, 10 + (i // 4) * 30, 190, 30)
+            self.source_checkboxes.append(checkbox)
+        controls_y = 20 + ((len(sources) + 3) // 4) * 30
+        self.start_button = QPushButton("Open selected", self)
+        self.start_button.setGeometry(10, controls_y, 150, 30)
+        self.start_button.clicked.connect(self.open_selected)
+        self.stop_button = QPushButton("Close all", self)
+        self.stop_button.setGeometry(170, controls_y, 150, 30)
+        self.stop_button.clicked.connect(self.close_streams)
+        self.grid_top = controls_y + 40
+
+        self.gray_pixmap = QtGui.QPixmap(self.cell_width, self.cell_height)
+        self.gray_pixmap.fill(Qt.darkGray)
+
+        self.render_timer = QTimer(self)
+        self.render_timer.setTimerType(Qt.PreciseTimer)
+        self.render_timer.setInterval(int(1000 / display_fps))
+        self.render_timer.timeout.connect(self.render_streams)
+        self.stats_timer = QTimer(self)
+        self.stats_timer.setInterval(1000)
+        self.stats_timer.timeout.connect(self.report_stats)
+        self.resize(max(4 * 200 + 20, self.cell_width + 20), self.grid_top + self.cell_height + 50)
+
+
+    def open_selected(self):
+        self.close_streams()
+        selected = [source for source, checkbox in zip(self.sources, self.source_checkboxes) if checkbox.isChecked()]
+        columns = max(1, ceil(len(selected) ** 0.5))
+        for i, (name, spec) in enumerate(selected):
+            stream = self.scheduler.add_stream(name, partial(make_source, spec),
+                                               display_shape=(self.cell_height, self.cell_width))
+            x = 10 + (i % columns) * (self.cell_width + 10)
+            y = self.grid_top + (i // columns) * (self.cell_height + 40)
+            video_label = QLabel(self)
+            video_label.setGeometry(x, y, self.cell_width, self.cell_height)
+            video_label.setPixmap(self.gray_pixmap)
+            video_label.show()
+            stats_label = QLabel(name, self)
+            stats_label.setGeometry(x, y + self.cell_height, self.cell_width, 30)
+            stats_label.show()
+            self.streams.append(stream)
+            self.cells.append((video_label, stats_label))
+        if self.streams:
+            rows = ceil(len(self.streams) / columns)
+            self.resize(max(self.width(), 10 + columns * (self.cell_width + 10)),
+                        self.grid_top + rows * (self.cell_height + 40) + 10)
+            self.render_timer.start()
+            self.stats_timer.start()
+
+
+    def render_streams(self):
+        for stream, (video_label, _) in zip(self.streams, self.cells):
+            frame = stream.buffer.take()
+            if frame is None:
+                continue
+            paint_start = time.perf_counter()
+            stream.latency.record("queue", paint_start - frame.prepared_time)
+            video_label.setPixmap(QtGui.QPixmap.fromImage(rgb_to_qimage(frame.display)))
+            paint_end = time.perf_counter()
+            stream.latency.record("paint", paint_end - paint_start)
+            stream.latency.record("total", paint_end - frame.capture_time)
+            stream.display_fps.tick(paint_end)
+
+
+    def report_stats(self):
+        for stream, (_, stats_label) in zip(self.streams, self.cells):
+            stats = stream.get_stats()
+            text = f"{stream.name}: capture {stats['capture_fps']:.0f} fps, display {stats['display_fps']:.0f} fps, " \
+                   f"latency p95 <= {stats['total_p95']} ms, dropped {stats['dropped'] + stats['coalesced']}"
+            if stats['error']:
+                text += f" - {stats['error']}"
+            stats_label.setText(text)
+
+
+    def close_streams(self):
+        self.render_timer.stop()
+        self.stats_timer.stop()
+        for stream in self.streams:
+            self.scheduler.remove_stream(stream)
+        for video_label, stats_label in self.cells:
+            video_label.deleteLater()
+            stats_label.deleteLater()
+        self.streams = []
+        self.cells = []
+
+
+    def closeEvent(self, event):
+        self.close_streams()
+        event.accept()
+
+
+    def shutdown(self):
+        # the app is closing - the scheduler's workers are stopped too
+        self.close_streams()
+        self.scheduler.stop()
+
+
+
 class ConfigurationsWindow(QWidget):
     def __init__(self, configs_dict, ser_th):
         super().__init__()
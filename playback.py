@@ -0,0 +1,283 @@
+import os
+import csv
+import time
+import bisect
+import threading
+import cv2
+from session import SessionReader
+from recorder import draw_overlay
+from frame_sources import FrameSource
+
+
+def read_sidecar_times(video_path):
+    # capture times from <video>.timestamps.csv written by VideoRecorder, [] if there is none
+    path = video_path + ".timestamps.csv"
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        rows = csv.reader(line for line in f if not line.startswith("#"))
+        next(rows, None)        # header
+        return [float(row[2]) if row[2] else None for row in rows]
+
+
+class PlaybackSource(FrameSource):
+    # a recorded video file or session folder as a FrameSource, so the frames go through the
+    # same preparer/buffer/render path as the camera ones.
+    # read() paces the frames by the file fps and the speed. it never blocks longer than max_wait and
+    # returns (True, None) when there is nothing to show yet (paused, or the next frame isn't due),
+    # so the capture thread still handles its requests.
+    # pause/resume/step/seek/set_speed are called from the GUI thread.
+    # a background thread builds thumbnails every thumbnail_interval seconds for scrubbing -
+    # thumbnail_for() is instant while the seek itself decodes from the previous keyframe.
+    # sessions also give the track_x/track_y logged for every frame, drawn into the frame
+    def __init__(self, path, thumbnail_interval=1.0, thumbnail_width=160, max_wait=0.05):
+        self.path = path
+        self.name = os.path.basename(os.path.normpath(path))
+        self.max_wait = max_wait
+        self.session = None
+        self.source_width = None        # width of the camera frames the coordinates refer to
+        self.files = []                 # (video path, first frame number)
+        if os.path.isdir(path):
+            self.session = SessionReader(path)
+            self._open_session()
+        else:
+            self.files.append((path, 0))
+            self.capture_times = read_sidecar_times(path)
+        self._starts = [start for _, start in self.files]
+
+        self._cap = None
+        self._file = -1
+        self.fps = 30
+        self.frame_count = 0
+        self._count_frames()
+
+        self._cond = threading.Condition()
+        self._closed = False
+        self.paused = False
+        self.speed = 1.0
+        self.position = 0               # the next frame read() gives
+        self.current = -1               # the last frame read() gave
+        self.current_tracking = None    # TrackingRecord of the current frame or None
+        self.show_coordinates = True
+        self._steps = 0
+        self._seek_to = None
+        self._clock_start = None        # perf_counter when the frame _clock_frame was due
+        self._clock_frame = 0
+
+        self.thumbnail_interval = thumbnail_interval
+        self.thumbnail_width = thumbnail_width
+        self._thumbnail_frames = []     # frame numbers, sorted
+        self._thumbnails = []           # small BGR frames
+        self.thumbnails_ready = False
+        self._thumbnail_thread = threading.Thread(target=self._build_thumbnails, daemon=True)
+        self._thumbnail_thread.start()
+
+    def _open_session(self):
+        # the segments in the order of the frame index, removed segments are skipped
+        frames = self.session.frames
+        segment_column = frames.column("segment")
+        for segment in sorted(self.session.segments):
+            path = self.session.segment_path(segment)
+            start = bisect.bisect_left(segment_column, segment)
+            if path is not None and start < len(frames) and frames[start].segment == segment:
+                self.files.append((path, start))
+        self.capture_times = frames.column("capture_time")
+        size = self.session.manifest.get("source_size")
+        self.source_width = size[0] if size else None
+
+    def _count_frames(self):
+        # the session index knows the count, a file asks the container
+        cap = cv2.VideoCapture(self.files[0][0]) if self.files else None
+        if cap is not None and cap.isOpened():
+            self.fps = cap.get(cv2.CAP_PROP_FPS) or 30
+            if self.session is None:
+                self.frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if cap is not None:
+            cap.release()
+        if self.session is not None:
+            self.fps = self.session.fps or self.fps
+            self.frame_count = self.session.frame_count()
+
+    def isOpened(self):
+        return bool(self.files) and self.frame_count > 0 and not self._closed
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.frame_count
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.current
+        return 0
+
+    def release(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thumbnail_thread.join()
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+        if self.session is not None:
+            self.session.close()
+
+    # controls, GUI thread
+
+    def pause(self):
+        with self._cond:
+            self.paused = True
+            self._cond.notify_all()
+
+    def resume(self):
+        with self._cond:
+            if self.position >= self.frame_count:
+                self._seek_to = 0           # from the start again
+            self.paused = False
+            self._clock_start = None
+            self._cond.notify_all()
+
+    def step(self, frames=1):
+        # frame-step while paused, negative goes back (that is a seek)
+        with self._cond:
+            self.paused = True
+            if frames > 0:
+                self._steps += frames
+            else:
+                self._seek_to = max(0, self.current + frames)
+            self._cond.notify_all()
+
+    def seek(self, frame):
+        with self._cond:
+            self._seek_to = min(max(0, int(frame)), max(0, self.frame_count - 1))
+            self._steps = 0
+            self._cond.notify_all()
+
+    def set_speed(self, speed):
+        with self._cond:
+            self.speed = speed
+            self._clock_start = None
+            self._cond.notify_all()
+
+    def thumbnail_for(self, frame):
+        # the nearest thumbnail at or before the frame, None until the first one is made
+        i = bisect.bisect_right(self._thumbnail_frames, frame) - 1
+        return self._thumbnails[i] if i >= 0 else None
+
+    # capture thread
+
+    def read(self):
+        with self._cond:
+            if self._closed:
+                return False, None
+            seek_to, self._seek_to = self._seek_to, None
+            skip = 0
+            if seek_to is None:
+                if self.position >= self.frame_count:
+                    self.paused = True          # the end - stay on the last frame
+                if self.paused:
+                    if not self._steps:
+                        self._cond.wait(self.max_wait)
+                        return True, None
+                    self._steps -= 1
+                else:
+                    now = time.perf_counter()
+                    if self._clock_start is None:
+                        self._clock_start = now
+                        self._clock_frame = self.position
+                    due = self._clock_start + (self.position - self._clock_frame) / (self.fps * self.speed)
+                    if due - now > 0:
+                        self._cond.wait(min(due - now, self.max_wait))
+                        return True, None
+                    # behind (slow decoding or high speed) - skip frames without decoding them
+                    skip = min(int((now - due) * self.fps * self.speed), self.frame_count - 1 - self.position)
+            else:
+                self._clock_start = None
+            position = self.position if seek_to is None else seek_to
+
+        # decoding is outside the lock, only this thread touches the capture
+        if seek_to is not None or self._file < 0:
+            if not self._reposition(position):
+                return False, None
+        for _ in range(skip):
+            if not self._grab_next():
+                break
+            position += 1
+        frame = self._read_next()
+        if frame is None:
+            with self._cond:
+                self.position = self.frame_count
+            return True, None
+        with self._cond:
+            self.current = position
+            self.position = position + 1
+        self._draw_coordinates(frame, position)
+        return True, frame
+
+    def _file_of(self, frame):
+        return max(0, bisect.bisect_right(self._starts, frame) - 1)
+
+    def _open_file(self, i):
+        if self._cap is not None:
+            self._cap.release()
+        self._cap = cv2.VideoCapture(self.files[i][0])
+        self._file = i
+        return self._cap.isOpened()
+
+    def _reposition(self, frame):
+        i = self._file_of(frame)
+        if i != self._file and not self._open_file(i):
+            return False
+        # the container seeks to the keyframe before and decodes up to the frame
+        self._cap.set(cv2.CAP_PROP_POS_FRAMES, frame - self.files[i][1])
+        return True
+
+    def _read_next(self):
+        ret, frame = self._cap.read()
+        if not ret and self._file + 1 < len(self.files):
+            # end of a segment, the next one follows
+            if not self._open_file(self._file + 1):
+                return None
+            ret, frame = self._cap.read()
+        return frame if ret else None
+
+    def _grab_next(self):
+        if self._cap.grab():
+            return True
+        if self._file + 1 < len(self.files) and self._open_file(self._file + 1):
+            return self._cap.grab()
+        return False
+
+    def _draw_coordinates(self, frame, n):
+        self.current_tracking = None
+        if self.session is None:
+            return
+        # the coordinates the device had sent when the frame was captured
+        self.current_tracking = self.session.tracking_for_frame(n, max_age=1.0)
+        if self.current_tracking is None or not self.show_coordinates:
+            return
+        overlay = {"track": (self.current_tracking.track_x, self.current_tracking.track_y),
+                   "box": None, "cursor": None, "width": self.source_width or frame.shape[1]}
+        draw_overlay(frame, overlay)
+
+    def _build_thumbnails(self):
+        # seeks to every thumbnail position - the container starts at the keyframe before it,
+        # the frames between the thumbnails aren't decoded
+        step = max(1, round(self.fps * self.thumbnail_interval))
+        ends = self._starts[1:] + [self.frame_count]
+        for (path, start), end in zip(self.files, ends):
+            cap = cv2.VideoCapture(path)
+            for n in range(0, end - start, step):
+                if self._closed:
+                    break
+                cap.set(cv2.CAP_PROP_POS_FRAMES, n)
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                height = round(frame.shape[0] * self.thumbnail_width / frame.shape[1])
+                thumbnail = cv2.resize(frame, (self.thumbnail_width, height), interpolation=cv2.INTER_AREA)
+                self._thumbnails.append(thumbnail)
+                self._thumbnail_frames.append(start + n)
+            cap.release()
+            if self._closed:
+                return
+        self.thumbnails_ready = True
@@ -0,0 +1,505 @@
+import os
+import time
+import queue
+import threading
+from collections import deque
+import cv2
+
+
+class VideoRecorder:
+    # frames are encoded to disk while the capture continues: write() only puts the frame
+    # into a bounded queue and a worker thread feeds the cv2.VideoWriter.
+    # when the encoder can't keep up the queue fills (backpressure) and new frames are dropped
+    # and counted, memory never grows past queue_size frames.
+    # the output fps is measured from the capture timestamps of the first frames (fps is only the
+    # fallback), then every frame is placed by its timestamp: frames are duplicated over gaps and
+    # dropped when they come too early, so the video plays in wall-clock time. the time of every
+    # output frame is written to <filename>.timestamps.csv
+    # with frame_size=None the writer takes the size of the first frame - used for the
+    # full resolution recording where the camera decides the size
+    # pre_event - PreEventBuffer, its frames are written first, before the live ones. until it is
+    # written the live frames go on into the pre-event buffer (compressed, not into the queue) and are
+    # taken from there, so a long pre-event doesn't make write() drop the frames right after the trigger.
+    # segment_seconds/segment_bytes - roll over to a new file (named by its start time) when the current
+    # one is that long/big, max_segments - the oldest segments are deleted above this count.
+    # the rollover happens on the worker thread, frames wait in the queue meanwhile.
+    # burn_overlay - draw the overlay given with each frame (see RecordingOverlay) into the video,
+    # on the worker thread so the live display doesn't pay for it.
+    # session - SessionWriter, gets the segments and a record per output frame, closed when the recording ends
+    def __init__(self, filename, fps, frame_size=None, fourcc="mp4v", queue_size=60, full_resolution=False,
+                 pre_event=None, fps_probe_frames=15, max_gap_seconds=10,
+                 segment_seconds=None, segment_bytes=None, max_segments=None, burn_overlay=False, session=None):
+        self.filename = filename        # the current segment
+        self.sidecar_filename = filename + ".timestamps.csv"
+        self.folder = os.path.dirname(filename)
+        self.segment_seconds = segment_seconds
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.segments = []              # files of this recording, oldest first
+        self.segment_count = 0          # all segments so far, the deleted ones too
+        self._segment_frames = 0
+        self._rollover_pending = False
+        self.fallback_fps = fps
+        self.fps = None                 # measured, known when the writer is opened
+        self.frame_size = tuple(frame_size) if frame_size else None     # width, height
+        self.fourcc = fourcc
+        self.full_resolution = full_resolution   # the capture thread gives the original frames
+        self.pre_event = pre_event
+        self.pre_event_frames = 0
+        self._route_lock = threading.Lock()
+        self._staging = pre_event is not None       # live frames go to the pre-event buffer
+        self._stop_time = None
+        self._finished = False      # the worker has ended - stopped, or failed (see error)
+        self.staging_dropped_frames = 0     # live frames lost in the pre-event buffer while it was written
+        self.burn_overlay = burn_overlay
+        self.session = session
+        self.fps_probe_frames = fps_probe_frames
+        self.max_gap_seconds = max_gap_seconds
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._writer = None
+        self._sidecar = None
+        self._probe = []                # first frames, kept until the fps is measured
+        self._first_capture_time = None
+        self._last_frame = None
+        self._last_capture_time = None
+        self.error = None               # set by the worker when it fails, the caller polls it
+
+        self.written_frames = 0         # camera frames in the file
+        self.output_frames = 0          # frames in the file, with the duplicates
+        self.duplicated_frames = 0
+        self.early_frames = 0           # dropped because an output frame for that time was already written
+        self.dropped_frames = 0         # dropped because the queue was full
+        self.max_queued = 0
+        self.encode_seconds = 0.0     # time spent inside VideoWriter.write
+        self.start_time = None
+        self.end_time = None
+
+    def start(self):
+        # the writer itself is opened by the worker once the fps is measured - an error there
+        # ends the worker and shows up in `error`
+        if self.folder:
+            try:
+                os.makedirs(self.folder, exist_ok=True)
+            except OSError as e:
+                self.error = f"couldn't create {self.folder}: {e}"
+                print(self.error)
+                return False
+        self.start_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return True
+
+    def _open_writer(self):
+        self._writer = cv2.VideoWriter(filename=self.filename, fourcc=cv2.VideoWriter_fourcc(*self.fourcc),
+                                       fps=self.fps, frameSize=self.frame_size, isColor=True)
+        if not self._writer.isOpened():
+            self._writer = None
+            self.error = f"couldn't open video writer for {self.filename}"
+            print(self.error)
+            return False
+        return True
+
+    def write(self, frame, capture_time=None, overlay=None) -> bool:
+        # frame - BGR, the recorder keeps the reference (and may draw on it), so don't reuse its memory
+        # after this call. capture_time - time.perf_counter() of the capture.
+        # overlay - RecordingOverlay.snapshot() taken for this frame.
+        # frames written before start() wait in the queue
+        with self._route_lock:
+            if self._finished or self._stop_time is not None:
+                return False        # nothing reads the queue any more
+            if self._staging:
+                self.pre_event.add(frame, capture_time, overlay)
+                return True
+            try:
+                self._queue.put_nowait((frame, capture_time, overlay))
+            except queue.Full:
+                self.dropped_frames += 1
+                return False
+        self.max_queued = max(self.max_queued, self._queue.qsize())
+        return True
+
+    def stop(self):
+        # no new frames, the queued ones are still written - call join() to wait for the file.
+        # doesn't block: a worker busy with a full queue ends when the queue is empty
+        if self._thread is not None:
+            with self._route_lock:
+                self._stop_time = time.perf_counter()
+            try:
+                self._queue.put_nowait((None, None, None))
+            except queue.Full:
+                pass
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        return True
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_backlog(self):
+        return self._queue.qsize()
+
+    def get_encode_fps(self):
+        # how many frames per second the encoder could do - compare with the camera fps
+        return self.output_frames / self.encode_seconds if self.encode_seconds else 0
+
+    def get_throughput(self):
+        # frames per second actually written since the start
+        if self.start_time is None:
+            return 0
+        elapsed = (self.end_time or time.perf_counter()) - self.start_time
+        return self.written_frames / elapsed if elapsed > 0 else 0
+
+    def is_segmented(self):
+        return bool(self.segment_seconds or self.segment_bytes)
+
+    def get_stats(self):
+        return {
+            "segments": len(self.segments),
+            "written": self.written_frames,
+            "dropped": self.dropped_frames,
+            "staging_dropped": self.staging_dropped_frames,
+            "duplicated": self.duplicated_frames,
+            "early": self.early_frames,
+            "fps": self.fps or 0,
+            "queued": self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "max_queued": self.max_queued,
+            "encode_fps": self.get_encode_fps(),
+            "throughput": self.get_throughput(),
+        }
+
+    def _measure_fps(self, frames):
+        times = [t for _, t in frames if t is not None]
+        if len(times) >= 2 and times[-1] > times[0]:
+            return round((len(times) - 1) / (times[-1] - times[0]), 2)
+        return self.fallback_fps or 30
+
+    def _handle_frame(self, frame, capture_time, overlay=None):
+        if self.burn_overlay and overlay is not None:
+            draw_overlay(frame, overlay)
+        if self._writer is None:
+            self._probe.append((frame, capture_time))
+            if len(self._probe) < self.fps_probe_frames:
+                return True
+            return self._flush_probe()
+        return self._write_timed(frame, capture_time)
+
+    def _flush_probe(self):
+        probe, self._probe = self._probe, []
+        if not probe:
+            return True
+        self.fps = self._measure_fps(probe)
+        if self.frame_size is None:
+            self.frame_size = (probe[0][0].shape[1], probe[0][0].shape[0])
+        first_time = next((t for _, t in probe if t is not None), None)
+        if not self._open_segment(first_time):
+            return False
+        print(f"recording at measured {self.fps} fps (camera reports {self.fallback_fps})")
+
+        for frame, capture_time in probe:
+            if not self._write_timed(frame, capture_time):
+                return False
+        return True
+
+    def _open_segment(self, capture_time):
+        if self.segment_count:
+            self.filename = make_recording_filename(self.folder, index=self.segment_count + 1)
+            self.sidecar_filename = self.filename + ".timestamps.csv"
+        if not self._open_writer():
+            return False
+        self._segment_frames = 0
+        self.segment_count += 1
+        self.segments.append(self.filename)
+        if self.session is not None:
+            self.session.add_segment(self.segment_count, self.filename, self.fps)
+
+        self._sidecar = open(self.sidecar_filename, "w")
+        if capture_time is not None:
+            # capture times are time.perf_counter(), this maps them to the wall clock
+            wall_time = time.time() - time.perf_counter() + capture_time
+            self._sidecar.write(f"# fps={self.fps} start_capture_time={capture_time:.6f} "
+                                f"start_wall_time={wall_time:.6f}\n")
+        self._sidecar.write("output_frame,video_time,capture_time,duplicate\n")
+
+        while self.max_segments and len(self.segments) > self.max_segments:
+            oldest = self.segments.pop(0)
+            for path in (oldest, oldest + ".timestamps.csv"):
+                if os.path.exists(path):
+                    os.remove(path)
+            print(f"segment removed: {oldest}")
+        return True
+
+    def _close_segment(self):
+        if self._writer is not None:
+            self._writer.release()
+        if self._sidecar is not None:
+            self._sidecar.close()
+            self._sidecar = None
+
+    def _segment_is_full(self):
+        if self.segment_seconds and self._segment_frames >= self.segment_seconds * self.fps:
+            return True
+        # the file size is checked once per second of video
+        if self.segment_bytes and self._segment_frames % max(1, int(self.fps)) == 0:
+            return os.path.getsize(self.filename) >= self.segment_bytes
+        return False
+
+    def _write_timed(self, frame, capture_time):
+        if capture_time is None:
+            return self._encode(frame, capture_time, duplicate=False)
+        if self._first_capture_time is None:
+            self._first_capture_time = capture_time
+
+        # position in output frames. a frame goes to the next free slot unless it is more than half a
+        # frame early (that time is already in the file) or at least a whole frame late (the missing
+        # time is filled with duplicates) - this way jitter around a slot border doesn't flip between both
+        position = (capture_time - self._first_capture_time) * self.fps
+        if position < self.output_frames - 0.5:
+            self.early_frames += 1
+            return True
+        gap = max(0, int(position - self.output_frames))
+        max_gap = int(self.fps * self.max_gap_seconds)
+        if gap > max_gap:
+            # the camera stopped for a long time, don't fill the file with the same frame
+            print(f"recording gap of {gap / self.fps:.1f} s, only {self.max_gap_seconds} s are filled")
+            self._first_capture_time += (gap - max_gap) / self.fps
+            gap = max_gap
+        for _ in range(gap):
+            if not self._encode(self._last_frame, self._last_capture_time, duplicate=True):
+                return False
+        return self._encode(frame, capture_time, duplicate=False)
+
+    def _encode(self, frame, capture_time, duplicate):
+        if self._rollover_pending:
+            self._rollover_pending = False
+            self._close_segment()
+            if not self._open_segment(capture_time):
+                self._writer = None
+                return False
+            print(f"new segment: {self.filename}")
+        if (frame.shape[1], frame.shape[0]) != self.frame_size:
+            frame = cv2.resize(frame, self.frame_size)
+        t = time.perf_counter()
+        self._writer.write(frame)      # releases the GIL while encoding
+        self.encode_seconds += time.perf_counter() - t
+        if self._sidecar is not None:
+            capture_text = f"{capture_time:.6f}" if capture_time is not None else ""
+            self._sidecar.write(f"{self._segment_frames},{self._segment_frames / self.fps:.6f},"
+                                f"{capture_text},{int(duplicate)}\n")
+        if self.session is not None:
+            self.session.add_frame(self.output_frames, capture_time, self.segment_count, self._segment_frames,
+                                   duplicate)
+        self.output_frames += 1
+        self._segment_frames += 1
+        if duplicate:
+            self.duplicated_frames += 1
+        else:
+            self.written_frames += 1
+        self._last_frame = frame
+        self._last_capture_time = capture_time
+        if self.is_segmented() and self._segment_is_full():
+            # the next frame opens a new file
+            self._rollover_pending = True
+        return True
+
+    def _write_pre_event(self):
+        # the seconds before the trigger, then the live frames that came meanwhile - taken from the
+        # pre-event buffer until it is nearly empty. then write() switches to the queue, and what the
+        # buffer got before the switch is written last
+        pre_event = self.pre_event
+        lost_before = pre_event.dropped_frames + pre_event.evicted_frames
+        staged = 0
+        while True:
+            frames = pre_event.flush()
+            caught_up = len(frames) <= 1 or self._stop_time is not None
+            if caught_up:
+                with self._route_lock:
+                    self._staging = False
+                frames += pre_event.flush()
+            for jpeg, capture_time, overlay in frames:
+                if self._stop_time is not None and capture_time is not None and capture_time > self._stop_time:
+                    continue        # the capture thread feeds the buffer again after stop()
+                frame = cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+                if frame is None:
+                    continue
+                if not self._handle_frame(frame, capture_time, overlay):
+                    return False
+                if capture_time is not None and capture_time >= self.start_time:
+                    staged += 1
+                else:
+                    self.pre_event_frames += 1
+            if caught_up:
+                break
+        self.staging_dropped_frames = pre_event.dropped_frames + pre_event.evicted_frames - lost_before
+        print(f"pre-event frames written: {self.pre_event_frames}, live frames taken from the pre-event "
+              f"buffer: {staged}, lost there: {self.staging_dropped_frames}")
+        return True
+
+    def _run(self):
+        try:
+            ok = self.pre_event is None or self._write_pre_event()
+            while ok:
+                try:
+                    frame, capture_time, overlay = self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    if self._stop_time is not None:
+                        break       # stop() found the queue full, it's written now
+                    continue
+                if frame is None:
+                    break
+                ok = self._handle_frame(frame, capture_time, overlay)
+            if ok and self._writer is None:
+                # shorter recording than the fps probe
+                self._flush_probe()
+        except Exception as e:
+            self.error = f"recording error: {e}"
+            print(self.error)
+        finally:
+            with self._route_lock:
+                self._finished = True
+            self.end_time = time.perf_counter()
+            self._close_segment()
+            if self.session is not None:
+                self.session.close()
+            print(f"recording finished: {self.filename}, written {self.written_frames}, "
+                  f"duplicated {self.duplicated_frames}, early {self.early_frames}, "
+                  f"dropped {self.dropped_frames}, encoder {self.get_encode_fps():.1f} fps")
+
+
+class PreEventBuffer:
+    # always-on rolling buffer of the last `seconds` of video, kept as JPEG so a few seconds of
+    # 1080p fit in max_bytes. the oldest frames are evicted first.
+    # add() is called from the capture thread, the compression runs on its own thread
+    def __init__(self, seconds=5, max_bytes=64 * 1024 * 1024, jpeg_quality=80):
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self.jpeg_quality = jpeg_quality
+        self._lock = threading.Lock()
+        self._frames = deque()          # (jpeg, capture_time, overlay), oldest on the left
+        self._bytes = 0
+        self._queue = queue.Queue(maxsize=4)
+        self.dropped_frames = 0         # the compression couldn't keep up
+        self.evicted_frames = 0         # older than `seconds` or over max_bytes
+        self.running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add(self, frame, capture_time, overlay=None):
+        # frame - BGR, it is kept until compressed so don't reuse its memory.
+        # the overlay is stored as it is and drawn by the recorder, like for the live frames
+        try:
+            self._queue.put_nowait((frame, capture_time, overlay))
+        except queue.Full:
+            self.dropped_frames += 1
+
+    def flush(self):
+        # waits for the frames already added, then returns all of them and empties the buffer
+        self._queue.join()
+        with self._lock:
+            frames = list(self._frames)
+            self._frames.clear()
+            self._bytes = 0
+        return frames
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._bytes = 0
+
+    def stop(self):
+        self.running = False
+        self._queue.put((None, None, None))
+
+    def get_stats(self):
+        with self._lock:
+            span = self._frames[-1][1] - self._frames[0][1] if len(self._frames) > 1 else 0
+            return {"frames": len(self._frames), "seconds": span, "bytes": self._bytes,
+                    "dropped": self.dropped_frames}
+
+    def _run(self):
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+        while self.running:
+            frame, capture_time, overlay = self._queue.get()
+            try:
+                if frame is None:
+                    break
+                ok, jpeg = cv2.imencode(".jpg", frame, params)
+                if ok:
+                    self._append(jpeg, capture_time, overlay)
+            except Exception as e:
+                print(f"pre-event buffer error: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _append(self, jpeg, capture_time, overlay):
+        with self._lock:
+            self._frames.append((jpeg, capture_time, overlay))
+            self._bytes += jpeg.nbytes
+            while self._frames and (self._bytes > self.max_bytes or
+                                    capture_time - self._frames[0][1] > self.seconds):
+                old, _, _ = self._frames.popleft()
+                self._bytes -= old.nbytes
+                self.evicted_frames += 1
+
+
+class RecordingOverlay:
+    # device tracking coordinates, track window and joystick cursor for the recorded frames.
+    # the GUI sets the values, the capture thread takes a snapshot for every recorded frame
+    # and the recorder draws it on its worker thread
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enabled = False
+        self._cursor = None         # in original frame coordinates
+
+    def set_cursor(self, x, y):
+        with self._lock:
+            self._cursor = (x, y)
+
+    def clear_cursor(self):
+        with self._lock:
+            self._cursor = None
+
+    def snapshot(self, track_window, track_box, original_shape):
+        # track_window - (track_x, track_y, size) from the device, track_box - x0, y0, x1, y1 or None,
+        # both in original frame coordinates
+        if not self.enabled:
+            return None
+        with self._lock:
+            cursor = self._cursor
+        return {"track": track_window[:2] if track_box else None, "box": track_box,
+                "cursor": cursor, "width": original_shape[1]}
+
+
+TRACK_COLOR = (0, 255, 0)       # BGR
+CURSOR_COLOR = (0, 0, 255)
+
+
+def draw_overlay(frame, overlay):
+    # the coordinates are in the original frame, the recorded frame may be downscaled
+    scale = frame.shape[1] / overlay["width"]
+    thickness = max(1, round(2 * scale))
+    if overlay["box"] is not None:
+        x0, y0, x1, y1 = [int(v * scale) for v in overlay["box"]]
+        cv2.rectangle(frame, (x0, y0), (x1, y1), TRACK_COLOR, thickness)
+    if overlay["track"] is not None:
+        track_x, track_y = overlay["track"]
+        center = (int(track_x * scale), int(track_y * scale))
+        cv2.drawMarker(frame, center, TRACK_COLOR, cv2.MARKER_CROSS, int(20 * scale), thickness)
+        cv2.putText(frame, f"track {track_x:.0f}, {track_y:.0f}", (10, int(30 * scale) + 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8 * scale, TRACK_COLOR, thickness)
+    if overlay["cursor"] is not None:
+        cursor_x, cursor_y = overlay["cursor"]
+        center = (int(cursor_x * scale), int(cursor_y * scale))
+        cv2.circle(frame, center, int(8 * scale) + 1, CURSOR_COLOR, thickness)
+        cv2.putText(frame, f"cursor {cursor_x:.0f}, {cursor_y:.0f}", (10, int(60 * scale) + 20),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8 * scale, CURSOR_COLOR, thickness)
+
+
+def make_recording_filename(folder="recordings", prefix="recording", ext=".mp4", index=None):
+    # index - segment number, keeps the names unique when segments start within the same second
+    suffix = f"_{index:03d}" if index is not None else ""
+    return os.path.join(folder, time.strftime(f"{prefix}_%Y%m%d_%H%M%S{suffix}{ext}"))
@@ -0,0 +1,138 @@
+import json
+from collections import namedtuple
+
+# the JSON messages in the text the device sends: flat objects ({"track_x": 10, "track_y": 20},
+# {"temperature": 41.5}, ...), a configuration snapshot is "[Config]" followed by its object, and
+# "Disconnected" when the device closes the connection. between them there can be anything -
+# "Connected", 0xff delimiters, noise after a reconnect
+Message = namedtuple("Message", "text data config")     # object text, parsed dict, after a [Config] tag
+
+CONFIG_TAG = b"[Config]"
+DISCONNECTED_TAG = b"Disconnected"
+_TAIL = max(len(CONFIG_TAG), len(DISCONNECTED_TAG))
+
+
+class JsonMessageFramer:
+    # cuts the received bytes into messages as they come. every byte is looked at once (bytes.find,
+    # so in C) and only an unfinished message is kept between feeds, at most max_message bytes of it.
+    # the messages are flat - a '{' inside an object means its '}' was lost, the broken part is dropped
+    # and the new object is taken from there. objects that aren't valid JSON are dropped too,
+    # the next one is read normally
+    def __init__(self, max_message=4096):
+        self.max_message = max_message
+        self._buffer = bytearray()      # the unfinished object, from its '{'
+        self._outside = bytearray()     # the end of the text between objects, for the tags
+        self._config_tag = False        # a [Config] tag since the last object
+        self._config = False            # the current object came after a [Config] tag
+        self._scan_start = 0            # where the scan of _buffer goes on
+        self.messages = 0
+        self.dropped = 0                # broken, invalid or too long objects
+        self.disconnected = False       # set when the tag is seen, cleared by the caller
+
+    def reset(self):
+        self._buffer.clear()
+        self._outside.clear()
+        self._config_tag = False
+        self.disconnected = False
+
+    def feed(self, data) -> list:
+        messages = []
+        if self._buffer:
+            start = 0
+            self._buffer += data
+            data = self._buffer
+            scan = self._scan_start
+        else:
+            start = -1
+            scan = 0
+        end = len(data)
+        while scan < end:
+            if start < 0:
+                start = data.find(b"{", scan)
+                self._add_outside(data, scan, end if start < 0 else start)
+                if start < 0:
+                    scan = end
+                    break
+                self._config = self._config_tag
+                self._config_tag = False
+                self._outside.clear()
+                scan = start + 1
+            close = data.find(b"}", scan)
+            broken = data.find(b"{", scan, end if close < 0 else close)
+            if broken >= 0:
+                # the previous object didn't end - start again from this one
+                self.dropped += 1
+                start = broken
+                scan = broken + 1
+                continue
+            if close < 0:
+                scan = end
+                break
+            self._take(bytes(data[start:close + 1]), messages)
+            start = -1
+            scan = close + 1
+
+        if start >= 0:
+            if end - start > self.max_message:
+                # no end in sight - garbage or a lost '}', look for the next object
+                self.dropped += 1
+                self._buffer = bytearray()
+            else:
+                if data is not self._buffer:
+                    self._buffer = bytearray(data[start:end])
+                elif start:
+                    del self._buffer[:start]
+                self._scan_start = end - start
+        else:
+            self._buffer = bytearray()
+        return messages
+
+    def _add_outside(self, data, start, end):
+        if end <= start:
+            return
+        self._outside += data[max(start, end - 256):end]
+        if CONFIG_TAG in self._outside:
+            self._config_tag = True
+        if DISCONNECTED_TAG in self._outside:
+            self.disconnected = True
+            self._outside.clear()
+        elif len(self._outside) > _TAIL:
+            # a tag can be split between two reads
+            del self._outside[:-_TAIL]
+
+    def _take(self, text, messages):
+        try:
+            data = json.loads(text)
+        except ValueError:      # JSONDecodeError, UnicodeDecodeError
+            self.dropped += 1
+            return
+        if not isinstance(data, dict):
+            self.dropped += 1
+            return
+        self.messages += 1
+        messages.append(Message(text.decode(), data, self._config))
+
+
+# what a message is, decoded on the serial thread - the GUI gets (kind, payload)
+TRACKING = "tracking"           # (track_x, track_y)
+CONFIG = "config"               # dict of all the parameters, after [Config]
+PARAMETER = "parameter"         # dict of the parameters in the message
+TEMPERATURE = "temperature"     # rounded degrees
+STATUS = "status"               # (name, value) of a mode switch
+DISCONNECTED = "disconnected"   # None
+STATUS_KEYS = ("tracking", "stabilization", "motion_det")
+
+
+def decode_message(message):
+    # (kind, payload) of a Message from JsonMessageFramer
+    data = message.data
+    if message.config:
+        return CONFIG, data
+    if list(data.keys()) == ['track_x', 'track_y']:
+        return TRACKING, (data['track_x'], data['track_y'])
+    for key in STATUS_KEYS:
+        if key in data:
+            return STATUS, (key, data[key])
+    if 'temperature' in data:
+        return TEMPERATURE, round(data['temperature'])
+    return PARAMETER, data
@@ -0,0 +1,136 @@
+import time
+import queue
+import threading
+
+# everything sent to the device goes out as whole messages - one write() per message instead of
+# one per character. the device frames JSON messages with 0xff on both sides, the cursor and
+# parameter commands of the GUI go unframed (the firmware finds the braces)
+FRAME_DELIMITER = b"\xff"
+BITS_PER_BYTE = 10      # start bit, 8 data bits, stop bit
+
+
+def frame_message(message, framed=True) -> bytes:
+    data = message.encode() if isinstance(message, str) else bytes(message)
+    if framed:
+        return FRAME_DELIMITER + data + FRAME_DELIMITER
+    return data
+
+
+def write_message(ser, message, framed=True) -> int:
+    # for the places without a SerialWriter (the port check, configs_classes)
+    return ser.write(frame_message(message, framed))
+
+
+class SerialWriter:
+    # the transmit path of the serial thread. every write after the port probe goes through send() -
+    # the serial thread's slots, MainApp.send_to_device and the configs writers - serialized by one lock
+    # (one queue when paced).
+    # pace=True is for firmware that reads the UART slower than the line rate: the bytes are written in
+    # chunks no faster than line_share of baud_rate, instead of the fixed per-character sleeps.
+    # the paced writes sleep, so they run on the writer's own thread - send() only queues the message
+    # (the send slots of the serial thread run on the GUI thread). close() writes the rest and stops it
+    def __init__(self, ser, baud_rate=None, pace=False, line_share=0.5, chunk_size=16):
+        self.serial = ser
+        self.baud_rate = baud_rate or getattr(ser, "baudrate", None) or 115200
+        self.pace = pace
+        self.line_share = line_share
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._free_time = 0.0       # pacing: when the bytes written so far are through
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.write_calls = 0
+        self._queue = None
+        self._thread = None
+        if pace:
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._run_paced, daemon=True)
+            self._thread.start()
+
+    def get_byte_time(self) -> float:
+        # seconds per byte when paced
+        return BITS_PER_BYTE / (self.baud_rate * self.line_share)
+
+    def send(self, message, framed=False) -> int:
+        data = frame_message(message, framed)
+        if self._queue is not None:
+            self._queue.put(data)
+            return len(data)
+        with self._lock:
+            self.serial.write(data)
+            self.write_calls += 1
+            self.messages_sent += 1
+            self.bytes_sent += len(data)
+        return len(data)
+
+    def close(self, timeout=1.0):
+        # the queued messages are still written (paced), at most for timeout seconds
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def _run_paced(self):
+        while True:
+            data = self._queue.get()
+            if data is None:
+                break
+            try:
+                with self._lock:
+                    self._write_paced(data)
+                    self.messages_sent += 1
+                    self.bytes_sent += len(data)
+            except Exception as e:
+                print(f"Send Error: {e}")
+
+    def _write_paced(self, data):
+        byte_time = self.get_byte_time()
+        for start in range(0, len(data), self.chunk_size):
+            chunk = data[start:start + self.chunk_size]
+            now = time.perf_counter()
+            if self._free_time > now:
+                time.sleep(self._free_time - now)
+            else:
+                self._free_time = now
+            self.serial.write(chunk)
+            self.write_calls += 1
+            self._free_time += len(chunk) * byte_time
+
+    def get_stats(self):
+        return {"messages": self.messages_sent, "bytes": self.bytes_sent, "writes": self.write_calls}
+
+
+class CursorQueue:
+    # latest value wins: a cursor position that comes before the rate limit allows replaces the
+    # pending one and goes out as soon as the limit allows, so the last position is always sent -
+    # at most `interval` after it came. the caller asks due_in() and takes the value when it's 0
+    def __init__(self, interval=1 / 30):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = None
+        self._last_sent = float("-inf")
+        self.sent = 0
+        self.coalesced = 0      # positions replaced by a newer one before they were sent
+
+    def put(self, value):
+        with self._lock:
+            if self._pending is not None:
+                self.coalesced += 1
+            self._pending = value
+
+    def due_in(self, now):
+        # seconds until the pending value may be sent, None when there is nothing to send
+        with self._lock:
+            if self._pending is None:
+                return None
+            return max(0.0, self._last_sent + self.interval - now)
+
+    def take(self, now):
+        with self._lock:
+            value, self._pending = self._pending, None
+            if value is not None:
+                self._last_sent = now
+                self.sent += 1
+            return value
+
+    def get_stats(self):
+        return {"sent": self.sent, "coalesced": self.coalesced}
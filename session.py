@@ -0,0 +1,250 @@
+import os
+import json
+import math
+import mmap
+import time
+import struct
+import bisect
+import threading
+from collections import namedtuple
+
+
+# one folder per recording run:
+#   session.json    - manifest: clock mapping, fps, video segments, counts
+#   *.mp4           - the video segments written by VideoRecorder
+#   frames.idx      - FRAME_RECORD per output frame
+#   serial.log      - raw bytes from the serial port, as they arrived
+#   serial.idx      - SERIAL_RECORD per read() from the port, points into serial.log
+#   tracking.idx    - TRACKING_RECORD per track_x/track_y message from the device
+# all the times are time.perf_counter() of this process - the capture thread, the serial thread and
+# the GUI share that clock, session.json maps it to the wall clock.
+# the records have a fixed size and are written in time order, so a reader finds a frame by number
+# with one seek and a frame/coordinate by time with a binary search
+
+FRAME_RECORD = struct.Struct("<QdIIB")      # frame number, capture time, segment, frame in segment, duplicate
+SERIAL_RECORD = struct.Struct("<dQI")       # arrival time, offset in serial.log, length
+TRACKING_RECORD = struct.Struct("<ddd")     # arrival time, track_x, track_y
+
+FrameRecord = namedtuple("FrameRecord", "frame capture_time segment segment_frame duplicate")
+SerialRecord = namedtuple("SerialRecord", "arrival_time offset length")
+TrackingRecord = namedtuple("TrackingRecord", "arrival_time track_x track_y")
+
+MANIFEST = "session.json"
+FRAMES_INDEX = "frames.idx"
+SERIAL_LOG = "serial.log"
+SERIAL_INDEX = "serial.idx"
+TRACKING_INDEX = "tracking.idx"
+
+
+def make_session_folder(folder="sessions", prefix="session"):
+    return os.path.join(folder, time.strftime(f"{prefix}_%Y%m%d_%H%M%S"))
+
+
+class SessionWriter:
+    # written from two threads: the recorder worker (frames) and the serial thread (raw messages, and
+    # the parsed tracking coordinates - SerialThread.add_tracking_coord). writes after close() are
+    # ignored, so the threads don't have to be stopped in a particular order
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._frames = open(os.path.join(folder, FRAMES_INDEX), "wb")
+        self._serial_log = open(os.path.join(folder, SERIAL_LOG), "wb")
+        self._serial_index = open(os.path.join(folder, SERIAL_INDEX), "wb")
+        self._tracking = open(os.path.join(folder, TRACKING_INDEX), "wb")
+        self._serial_offset = 0
+        self.closed = False
+        self.fps = None
+        self.source_size = None         # width, height of the camera frames, the coordinates refer to them
+        self.segments = []              # (segment number, file name in the folder)
+        self.frame_count = 0
+        self.serial_count = 0
+        self.tracking_count = 0
+        self._last_capture_time = -math.inf
+        self.start_perf_counter = time.perf_counter()
+        self.start_wall_time = time.time()
+        self._write_manifest()
+
+    def add_segment(self, segment, filename, fps):
+        # segment - running number of the recorder, kept in the frame records
+        with self._lock:
+            self.fps = fps
+            self.segments.append((segment, os.path.basename(filename)))
+        self._write_manifest()
+
+    def set_source_size(self, width, height):
+        with self._lock:
+            self.source_size = (width, height)
+        self._write_manifest()
+
+    def add_frame(self, frame, capture_time, segment, segment_frame, duplicate=False):
+        with self._lock:
+            if self.closed:
+                return
+            if capture_time is None:
+                # no timestamp - the frame is placed right after the previous one
+                capture_time = self._last_capture_time if self.frame_count else time.perf_counter()
+            # the binary search needs sorted times, the recorder never goes back but be sure
+            if capture_time < self._last_capture_time:
+                capture_time = self._last_capture_time
+            self._last_capture_time = capture_time
+            self._frames.write(FRAME_RECORD.pack(frame, capture_time, segment, segment_frame, duplicate))
+            self.frame_count += 1
+
+    def add_serial(self, data: bytes, arrival_time):
+        with self._lock:
+            if self.closed:
+                return
+            self._serial_log.write(data)
+            self._serial_index.write(SERIAL_RECORD.pack(arrival_time, self._serial_offset, len(data)))
+            self._serial_offset += len(data)
+            self.serial_count += 1
+
+    def add_tracking(self, arrival_time, track_x, track_y):
+        with self._lock:
+            if self.closed:
+                return
+            self._tracking.write(TRACKING_RECORD.pack(arrival_time, track_x, track_y))
+            self.tracking_count += 1
+
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            for f in (self._frames, self._serial_log, self._serial_index, self._tracking):
+                f.close()
+        self._write_manifest()
+        print(f"session closed: {self.folder}, {self.frame_count} frames, {self.serial_count} serial reads, "
+              f"{self.tracking_count} tracking coordinates")
+
+    def _write_manifest(self):
+        with self._lock:
+            manifest = {
+                "version": 1,
+                "clock": "perf_counter",
+                "start_perf_counter": self.start_perf_counter,
+                "start_wall_time": self.start_wall_time,
+                "fps": self.fps,
+                "source_size": self.source_size,
+                "segments": [{"segment": segment, "file": name} for segment, name in self.segments],
+                "frames": self.frame_count,
+                "serial_reads": self.serial_count,
+                "tracking_coordinates": self.tracking_count,
+                "complete": self.closed,
+            }
+        path = os.path.join(self.folder, MANIFEST)
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(path + ".tmp", path)
+
+
+class RecordFile:
+    # fixed-size records of a .idx file as a read-only sequence, only the requested records are unpacked
+    def __init__(self, path, record, record_type):
+        self._record = record
+        self._type = record_type
+        self._file = open(path, "rb")
+        size = os.path.getsize(path)
+        self._count = size // record.size
+        # mmap can't map an empty file
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return self._type(*self._record.unpack_from(self._data, i * self._record.size))
+
+    def column(self, field):
+        return _Column(self, self._type._fields.index(field))
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+
+class _Column:
+    # one field of a RecordFile, for bisect
+    def __init__(self, records, index):
+        self._records = records
+        self._index = index
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, i):
+        return self._records[i][self._index]
+
+
+class SessionReader:
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self.fps = self.manifest.get("fps")
+        self.segments = {item["segment"]: item["file"] for item in self.manifest.get("segments", [])}
+        self.frames = RecordFile(os.path.join(folder, FRAMES_INDEX), FRAME_RECORD, FrameRecord)
+        self.serial = RecordFile(os.path.join(folder, SERIAL_INDEX), SERIAL_RECORD, SerialRecord)
+        self.tracking = RecordFile(os.path.join(folder, TRACKING_INDEX), TRACKING_RECORD, TrackingRecord)
+        self._capture_times = self.frames.column("capture_time")
+        self._tracking_times = self.tracking.column("arrival_time")
+        self._serial_times = self.serial.column("arrival_time")
+
+    def close(self):
+        for records in (self.frames, self.serial, self.tracking):
+            records.close()
+
+    def frame_count(self):
+        return len(self.frames)
+
+    def frame(self, n) -> FrameRecord:
+        return self.frames[n]
+
+    def segment_path(self, segment):
+        # None when the segment was removed by the retention or never written
+        name = self.segments.get(segment)
+        if name is None:
+            return None
+        path = os.path.join(self.folder, name)
+        return path if os.path.exists(path) else None
+
+    def frame_at_time(self, t):
+        # the last output frame captured at or before t, None before the first frame
+        i = bisect.bisect_right(self._capture_times, t) - 1
+        return self.frames[i] if i >= 0 else None
+
+    def tracking_at_time(self, t, max_age=None):
+        # the last coordinates the device sent at or before t, None if there are none
+        # or they are older than max_age seconds
+        i = bisect.bisect_right(self._tracking_times, t) - 1
+        if i < 0:
+            return None
+        record = self.tracking[i]
+        if max_age is not None and t - record.arrival_time > max_age:
+            return None
+        return record
+
+    def tracking_for_frame(self, n, max_age=None):
+        return self.tracking_at_time(self.frames[n].capture_time, max_age)
+
+    def serial_between(self, t0, t1):
+        # raw serial data that arrived in [t0, t1): list of (arrival time, bytes)
+        start = bisect.bisect_left(self._serial_times, t0)
+        end = bisect.bisect_left(self._serial_times, t1)
+        if start >= end:
+            return []
+        records = [self.serial[i] for i in range(start, end)]
+        with open(os.path.join(self.folder, SERIAL_LOG), "rb") as f:
+            f.seek(records[0].offset)
+            data = f.read(records[-1].offset + records[-1].length - records[0].offset)
+        base = records[0].offset
+        return [(r.arrival_time, data[r.offset - base:r.offset - base + r.length]) for r in records]
+
+    def to_wall_time(self, t):
+        return self.manifest["start_wall_time"] + t - self.manifest["start_perf_counter"]
@@ -0,0 +1,307 @@
+import time
+import multiprocessing
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+from frame_sources import make_source, source_name
+from video_pipeline import PreparedFrame
+
+
+# capture + resize + colour conversion in a child process, so they don't share the GIL with the Qt
+# thread, the serial thread and the joystick. the child writes straight into a ring of preallocated
+# slots in shared memory and the GUI process maps the same memory - frames are never pickled or copied.
+#
+# a slot is owned by one side at a time, the state says who:
+#   FREE -> WRITING -> READY        child only
+#   READY -> READING -> FREE        GUI process only (READY -> FREE when a newer frame is taken)
+# every transition is done by a single side, so there are no locks that a crashed child could keep.
+# the child only writes into FREE slots - when there is none the new frame is dropped.
+# a semaphore counts the published frames, the GUI side waits on it.
+# perf_counter is system wide (CLOCK_MONOTONIC / QueryPerformanceCounter), the child's capture
+# times are on the same clock as the GUI's
+
+FREE, WRITING, READY, READING = 0, 1, 2, 3
+STARTING, RUNNING, SOURCE_FAILED = 0, 1, 2
+
+HEADER_DTYPE = np.dtype([("heartbeat", np.float64), ("status", np.int32), ("want_original", np.int32),
+                         ("frames", np.int64), ("dropped", np.int64),
+                         ("track_box", np.int32, (4,))])       # x0, y0, x1, y1 of the track window or zeros
+SLOT_DTYPE = np.dtype([("state", np.int32), ("has_original", np.int32), ("seq", np.int64),
+                       ("capture_time", np.float64), ("prepared_time", np.float64),
+                       ("height", np.int32), ("width", np.int32),
+                       ("track_box", np.int32, (4,))])        # of the region copied instead of the whole frame
+
+
+class SharedFrameRing:
+    # the layout of the shared memory: header, slot table, then per slot the resized BGR frame,
+    # the display RGB frame and room for the original camera frame
+    def __init__(self, slots, display_shape, max_shape, name=None):
+        self.slots = slots
+        self.display_shape = tuple(display_shape)       # height, width
+        self.max_shape = tuple(max_shape)               # height, width
+        display_bytes = self.display_shape[0] * self.display_shape[1] * 3
+        original_bytes = self.max_shape[0] * self.max_shape[1] * 3
+        offsets = [HEADER_DTYPE.itemsize, SLOT_DTYPE.itemsize * slots]
+        size = sum(offsets) + slots * (2 * display_bytes + original_bytes)
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = attach_shared_memory(name)
+        self.name = self.shm.name
+        buf = self.shm.buf
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=buf)
+        self.table = np.ndarray((slots,), dtype=SLOT_DTYPE, buffer=buf, offset=offsets[0])
+        offset = sum(offsets)
+        self.resized, self.display, self.original = [], [], []
+        for _ in range(slots):
+            self.resized.append(np.ndarray(self.display_shape + (3,), np.uint8, buf, offset))
+            offset += display_bytes
+            self.display.append(np.ndarray(self.display_shape + (3,), np.uint8, buf, offset))
+            offset += display_bytes
+            self.original.append(np.ndarray(self.max_shape + (3,), np.uint8, buf, offset))
+            offset += original_bytes
+        if name is None:
+            self.table["state"] = FREE
+            self.header["status"] = STARTING
+
+    def layout(self):
+        # what the child needs to map the same memory
+        return self.name, self.slots, self.display_shape, self.max_shape
+
+    def close(self):
+        # the numpy views have to go first, mmap can't be closed while they exist
+        self.header = self.table = None
+        self.resized = self.display = self.original = []
+        try:
+            self.shm.close()
+        except BufferError:
+            # frames still referenced by the GUI, the memory goes away with the last of them
+            print("shared frames still in use, the memory is freed later")
+
+
+def attach_shared_memory(name):
+    # the creator owns (and unlinks) the memory. a spawned child shares the parent's resource
+    # tracker, registering the name again there is harmless, unregistering it is not
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)     # python 3.13+
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def capture_process_main(layout, source_spec, frame_semaphore, stop_event):
+    # the child process: read, resize and convert into a free slot, publish
+    ring = SharedFrameRing(*layout[1:], name=layout[0])
+    header, table = ring.header, ring.table
+    height, width = ring.display_shape
+    source = make_source(source_spec)
+    if not source.isOpened():
+        header["status"] = SOURCE_FAILED
+        source.release()
+        ring.close()
+        return
+    header["status"] = RUNNING
+    seq = 0
+    try:
+        while not stop_event.is_set():
+            header["heartbeat"] = time.perf_counter()
+            ret, frame = source.read()
+            capture_time = time.perf_counter()
+            if not ret:
+                time.sleep(0.03)
+                continue
+            if frame is None:
+                continue
+            free = np.flatnonzero(table["state"] == FREE)
+            if free.size == 0:
+                header["dropped"] += 1        # the GUI side holds all the slots
+                continue
+            slot = int(free[0])
+            table["state"][slot] = WRITING
+            cv2.resize(frame, (width, height), dst=ring.resized[slot])
+            cv2.cvtColor(ring.resized[slot], cv2.COLOR_BGR2RGB, dst=ring.display[slot])
+            frame_height, frame_width = frame.shape[:2]
+            has_original = bool(header["want_original"]) and frame_height <= ring.max_shape[0] \
+                and frame_width <= ring.max_shape[1]
+            # without the whole frame only the track window region is copied, packed at the slot start
+            x0, y0, x1, y1 = (int(v) for v in header["track_box"])
+            has_region = not has_original and 0 <= x0 < x1 <= frame_width and 0 <= y0 < y1 <= frame_height
+            if has_original:
+                ring.original[slot][:frame_height, :frame_width] = frame
+            elif has_region:
+                region = ring.original[slot].reshape(-1)[:(y1 - y0) * (x1 - x0) * 3]
+                region.reshape(y1 - y0, x1 - x0, 3)[...] = frame[y0:y1, x0:x1]
+            seq += 1
+            record = table[slot]
+            record["has_original"] = has_original
+            record["track_box"] = (x0, y0, x1, y1) if has_region else (0, 0, 0, 0)
+            record["seq"] = seq
+            record["capture_time"] = capture_time
+            record["prepared_time"] = time.perf_counter()
+            record["height"] = frame_height
+            record["width"] = frame_width
+            record["state"] = READY           # the last write - the slot is complete
+            header["frames"] += 1
+            frame_semaphore.release()
+    finally:
+        source.release()
+        del header, table
+        ring.close()
+
+
+class SharedFrame(PreparedFrame):
+    # PreparedFrame over a shared memory slot. it goes back to the ring (owner.release), not to a preparer pool
+    def __init__(self, ring, slot, owner):
+        self.owner = owner
+        self.slot = slot
+        self.resized = ring.resized[slot]
+        self.display = ring.display[slot]
+        self._original_buffer = ring.original[slot]
+        self.original = None            # view of the camera frame if the child copied it
+        self.track_region = None        # or of the track window region only
+        self.track_region_box = None
+        self.track_buffer = None
+        self.track = None
+        self.original_shape = None
+        self.track_size = 0
+        self.seq = 0
+        self.capture_time = 0.0
+        self.prepared_time = 0.0
+
+    def fits(self, display_shape):
+        return False
+
+
+class ProcessCapture:
+    # the GUI process side: starts the child, takes the newest frame, gives slots back and restarts
+    # the child when it crashed or hangs (no heartbeat for hang_timeout seconds).
+    # more than max_restarts restarts within restart_window seconds - gives up
+    def __init__(self, source_spec, display_shape=(540, 960), max_shape=(1080, 1920), slots=5,
+                 hang_timeout=5.0, max_restarts=3, restart_window=30.0):
+        self.source_spec = source_spec
+        self.name = f"{source_name(source_spec)} (process)"
+        self.hang_timeout = hang_timeout
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self._context = multiprocessing.get_context("spawn")   # no fork of a process with Qt threads
+        self.ring = SharedFrameRing(slots, display_shape, max_shape)
+        self.frames = [SharedFrame(self.ring, slot, self) for slot in range(slots)]
+        self._semaphore = self._context.Semaphore(0)
+        self._stop_event = self._context.Event()
+        self.process = None
+        self._restarts = []
+        self.restart_count = 0
+        self.dropped_frames = 0         # READY frames replaced by a newer one before they were taken
+        self.failed = False
+        self._last_seq = 0
+        self.last_shape = None          # of the camera frames, for the track window box
+
+    def start(self):
+        self._stop_event.clear()
+        self.ring.header["status"] = STARTING
+        self.ring.header["heartbeat"] = time.perf_counter()
+        self.process = self._context.Process(target=capture_process_main, daemon=True,
+                                             args=(self.ring.layout(), self.source_spec,
+                                                   self._semaphore, self._stop_event))
+        self.process.start()
+
+    def set_want_original(self, enabled):
+        # the child copies the camera frame too - for full resolution recording
+        self.ring.header["want_original"] = int(enabled)
+
+    def set_track_box(self, box):
+        # FramePreparer.track_window_box() - the child copies this region of the camera frame,
+        # so the track window has the camera's resolution without copying whole frames
+        self.ring.header["track_box"] = box or (0, 0, 0, 0)
+
+    def wait_frame(self, timeout=0.05):
+        # the newest READY frame or None, the older READY ones are freed (dropped)
+        if not self._semaphore.acquire(timeout=timeout):
+            return None
+        while self._semaphore.acquire(False):
+            pass
+        table = self.ring.table
+        ready = np.flatnonzero(table["state"] == READY)
+        if ready.size == 0:
+            return None
+        newest = int(ready[np.argmax(table["seq"][ready])])
+        for slot in ready:
+            if slot != newest:
+                table["state"][slot] = FREE
+                self.dropped_frames += 1
+        record = table[newest]
+        record["state"] = READING
+        frame = self.frames[newest]
+        height, width = int(record["height"]), int(record["width"])
+        frame.original_shape = (height, width, 3)
+        frame.original = frame._original_buffer[:height, :width] if record["has_original"] else None
+        x0, y0, x1, y1 = (int(v) for v in record["track_box"])
+        if x1 > x0:
+            region = frame._original_buffer.reshape(-1)[:(y1 - y0) * (x1 - x0) * 3]
+            frame.track_region = region.reshape(y1 - y0, x1 - x0, 3)
+            frame.track_region_box = (x0, y0, x1, y1)
+        else:
+            frame.track_region = frame.track_region_box = None
+        self.last_shape = frame.original_shape
+        frame.seq = int(record["seq"])
+        frame.capture_time = float(record["capture_time"])
+        frame.prepared_time = float(record["prepared_time"])
+        frame.track = None
+        return frame
+
+    def release(self, frame):
+        if self.ring.table is not None:
+            self.ring.table["state"][frame.slot] = FREE
+
+    def check(self) -> bool:
+        # called when no frame came for a while. False - the source can't be used (gave up)
+        if self.failed:
+            return False
+        status = int(self.ring.header["status"])
+        if status == SOURCE_FAILED:
+            print(f"{self.name}: the source couldn't be opened")
+            self.failed = True
+            return False
+        alive = self.process is not None and self.process.is_alive()
+        hung = alive and status == RUNNING and \
+            time.perf_counter() - float(self.ring.header["heartbeat"]) > self.hang_timeout
+        if alive and not hung:
+            return True
+        if hung:
+            print(f"{self.name}: capture process doesn't respond, restarting")
+            self.process.terminate()
+            self.process.join(1)
+        else:
+            print(f"{self.name}: capture process exited with {self.process.exitcode}, restarting")
+        now = time.perf_counter()
+        self._restarts = [t for t in self._restarts if now - t < self.restart_window] + [now]
+        if len(self._restarts) > self.max_restarts:
+            print(f"{self.name}: too many restarts, giving up")
+            self.failed = True
+            return False
+        # slots the dead child was writing are free again, the ones the GUI holds stay as they are
+        table = self.ring.table
+        table["state"][table["state"] == WRITING] = FREE
+        self.restart_count += 1
+        self.start()
+        return True
+
+    def get_stats(self):
+        header = self.ring.header
+        if header is None:          # stopped
+            return {"frames": 0, "child_dropped": 0, "dropped": self.dropped_frames, "restarts": self.restart_count}
+        return {"frames": int(header["frames"]), "child_dropped": int(header["dropped"]),
+                "dropped": self.dropped_frames, "restarts": self.restart_count}
+
+    def stop(self):
+        # asks the child to stop, waits a bit, then kills it. the shared memory is unlinked here,
+        # it disappears when the child and the GUI views are gone
+        if self.process is not None:
+            self._stop_event.set()
+            self.process.join(2)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join(1)
+            self.process = None
+        self.frames = []
+        self.ring.shm.unlink()
+        self.ring.close()
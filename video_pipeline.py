@@ -0,0 +1,482 @@
+import threading
+import time
+from collections import deque
+import cv2
+import numpy as np
+from PyQt5.QtGui import QImage
+
+
+class LatestFrameBuffer:
+    # single slot hand-off between the capture thread and the GUI thread.
+    # a new frame replaces the one that was not taken yet (latest frame wins),
+    # so a slow consumer never makes frames pile up in the Qt event queue.
+    # on_release is called for frames nobody uses any more - the dropped ones and the
+    # previously taken one - so their preallocated memory can be reused by the producer
+    def __init__(self, on_release=None):
+        self._lock = threading.Lock()
+        self._frame = None
+        self._taken = None       # the frame the consumer is holding now
+        self._on_release = on_release
+        self.dropped_frames = 0
+        self.delivered_frames = 0
+        self.last_take_time = None      # the consumer's last look at the slot, with or without a frame
+
+    def put(self, frame) -> bool:
+        # returns True when the slot was empty - only then the consumer has to be notified,
+        # otherwise a notification is already on its way
+        with self._lock:
+            dropped = self._frame
+            was_empty = dropped is None
+            if not was_empty:
+                self.dropped_frames += 1
+            self._frame = frame
+        if dropped is not None:
+            self._release(dropped)
+        return was_empty
+
+    def take(self):
+        # the returned frame stays valid until the next take()
+        with self._lock:
+            self.last_take_time = time.perf_counter()
+            frame = self._frame
+            self._frame = None
+            previous = None
+            if frame is not None:
+                self.delivered_frames += 1
+                previous = self._taken
+                self._taken = frame
+        if previous is not None:
+            self._release(previous)
+        return frame
+
+    def clear(self):
+        # drops the frame that wasn't taken. the taken one can still be on the screen, it goes back
+        # with the next take() or release_taken()
+        with self._lock:
+            frame = self._frame
+            self._frame = None
+        if frame is not None:
+            self._release(frame)
+
+    def release_taken(self):
+        # the consumer doesn't show the taken frame any more
+        with self._lock:
+            frame = self._taken
+            self._taken = None
+        if frame is not None:
+            self._release(frame)
+
+    def _release(self, frame):
+        if self._on_release is not None:
+            self._on_release(frame)
+
+    def get_dropped_count(self) -> int:
+        return self.dropped_frames
+
+    def will_be_taken(self, now, take_interval, frame_interval, margin=0.004):
+        # False when a frame finished now would be replaced by the next one before the consumer
+        # takes it - the consumer takes every take_interval, frames come every frame_interval,
+        # margin is the time the frame still needs to be ready (decode, prepare)
+        last = self.last_take_time
+        if last is None or not take_interval or not frame_interval:
+            return True
+        elapsed = max(0.0, now - last)
+        next_take = last + (int(elapsed / take_interval) + 1) * take_interval
+        return next_take - now < frame_interval + margin
+
+    def reset_counters(self):
+        with self._lock:
+            self.dropped_frames = 0
+            self.delivered_frames = 0
+
+
+class FpsCounter:
+    # frames per second over a sliding window, tick() and get_fps() can be called from different threads
+    def __init__(self, window=1.0):
+        self.window = window
+        self._lock = threading.Lock()
+        self._times = deque()
+
+    def tick(self, now=None):
+        now = time.perf_counter() if now is None else now
+        with self._lock:
+            self._times.append(now)
+            self._drop_old(now)
+
+    def get_fps(self) -> float:
+        with self._lock:
+            self._drop_old(time.perf_counter())
+            return len(self._times) / self.window
+
+    def reset(self):
+        with self._lock:
+            self._times.clear()
+
+    def _drop_old(self, now):
+        while self._times and now - self._times[0] > self.window:
+            self._times.popleft()
+
+
+class LatencyHistogram:
+    # fixed buckets in milliseconds, the last one is everything above the last edge
+    BUCKET_EDGES_MS = (1, 2, 4, 8, 16, 33, 50, 100, 200, 500, 1000)
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(self.BUCKET_EDGES_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, seconds):
+        ms = seconds * 1000
+        i = 0
+        while i < len(self.BUCKET_EDGES_MS) and ms > self.BUCKET_EDGES_MS[i]:
+            i += 1
+        with self._lock:
+            self.counts[i] += 1
+            self.total += 1
+            self.sum_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(self.BUCKET_EDGES_MS) + 1)
+            self.total = 0
+            self.sum_ms = 0.0
+            self.max_ms = 0.0
+
+    def percentile(self, p):
+        # upper edge of the bucket where the percentile falls
+        with self._lock:
+            if self.total == 0:
+                return 0
+            limit = self.total * p / 100
+            running = 0
+            for i, count in enumerate(self.counts):
+                running += count
+                if running >= limit:
+                    return self.BUCKET_EDGES_MS[i] if i < len(self.BUCKET_EDGES_MS) else float("inf")
+        return float("inf")
+
+    def to_text(self):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.total
+            mean = self.sum_ms / total if total else 0
+            max_ms = self.max_ms
+        text = f"{self.name}: n={total} mean={mean:.1f}ms p50<={self.percentile(50)}ms " \
+               f"p95<={self.percentile(95)}ms max={max_ms:.1f}ms\n"
+        low = 0
+        for i, count in enumerate(counts):
+            high = f"{self.BUCKET_EDGES_MS[i]}" if i < len(self.BUCKET_EDGES_MS) else "inf"
+            if count:
+                share = count / total * 100
+                text += f"  {low:>4}-{high:<4} ms {count:>7} {share:5.1f}% {'#' * int(share / 4)}\n"
+            low = high
+        return text
+
+
+class LatencyStats:
+    # a histogram per pipeline stage:
+    # capture - read() call, prepare - resize/convert/crop, queue - waiting in the buffer,
+    # paint - update_frame, total - from capture to the frame being on the screen
+    STAGES = ("capture", "prepare", "queue", "paint", "total")
+
+    def __init__(self):
+        self.histograms = {stage: LatencyHistogram(stage) for stage in self.STAGES}
+
+    def record(self, stage, seconds):
+        self.histograms[stage].record(seconds)
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
+
+    def to_text(self):
+        return "".join(self.histograms[stage].to_text() for stage in self.STAGES)
+
+    def dump(self, filename="latency_histograms.txt"):
+        with open(filename, "a") as f:
+            f.write(time.strftime("%Y-%m-%d %H:%M:%S") + "\n")
+            f.write(self.to_text() + "\n")
+
+
+class PreparedFrame:
+    # display-ready data produced by FramePreparer, the GUI only wraps it into pixmaps.
+    # the arrays are preallocated and reused, so the object goes back to the preparer's
+    # pool when the buffer releases it - nothing should keep references to them after that
+    def __init__(self, display_shape):
+        height, width = display_shape
+        self.resized = np.empty((height, width, 3), dtype=np.uint8)   # BGR, resize destination
+        self.display = np.empty((height, width, 3), dtype=np.uint8)   # RGB, cvtColor destination
+        self.original = None            # the camera frame itself (not a copy), dropped when the frame is released
+        self.track_region = None        # only the track_window_box() region of it (capture process)
+        self.track_region_box = None
+        self.track_buffer = None        # RGB, reallocated only when the track window size changes
+        self.track = None               # view of track_buffer for the current frame or None
+        self.original_shape = None      # height, width, ch of the camera frame
+        self.track_size = 0             # of the track window on the screen, in pixels
+        self.seq = 0                    # frame number since the camera was opened
+        self.capture_time = 0.0         # time.perf_counter() when read() returned the frame
+        self.prepared_time = 0.0        # time.perf_counter() when the preparation finished
+
+    def fits(self, display_shape):
+        return self.resized.shape[:2] == tuple(display_shape)
+
+
+class FramePreparer:
+    # resize + BGR->RGB conversion + track window crop, runs on the capture thread
+    # so the Qt main thread is free for joystick, serial and widgets.
+    # the output goes into a small pool of preallocated PreparedFrame objects: one is being
+    # written here, one waits in the LatestFrameBuffer and one is held by the GUI
+    def __init__(self, display_shape=(540, 960), pool_size=3, max_track_size=320):
+        self._lock = threading.Lock()
+        self.display_shape = list(display_shape)   # height, width
+        self.max_track_size = max_track_size        # larger track windows of big frames are scaled down
+        self._track_x = 0        # in original frame coordinates, as the device sends them
+        self._track_y = 0
+        self._track_size = 0
+        self.interpolation = cv2.INTER_LINEAR
+        self._pool_lock = threading.Lock()
+        self._pool = [PreparedFrame(self.display_shape) for _ in range(pool_size)]
+
+    def release(self, prepared):
+        # called by LatestFrameBuffer when the frame is not used any more
+        prepared.original = None
+        with self._pool_lock:
+            if prepared.fits(self.display_shape):
+                self._pool.append(prepared)
+
+    def _acquire(self) -> PreparedFrame:
+        with self._pool_lock:
+            while self._pool:
+                prepared = self._pool.pop()
+                if prepared.fits(self.display_shape):
+                    return prepared
+        # pool is empty only if someone keeps frames longer than expected
+        return PreparedFrame(self.display_shape)
+
+    def set_track_window(self, x, y, size):
+        with self._lock:
+            self._track_x = x or 0
+            self._track_y = y or 0
+            self._track_size = int(size or 0)
+
+    def clear_track_window(self):
+        self.set_track_window(0, 0, 0)
+
+    def get_track_window(self):
+        with self._lock:
+            return self._track_x, self._track_y, self._track_size
+
+    def set_quality(self, interpolation):
+        # set by AdaptiveQuality, used from the next prepared frame
+        with self._lock:
+            self.interpolation = interpolation
+
+    def prepare(self, frame, seq=0, capture_time=0.0) -> PreparedFrame:
+        height, width = self.display_shape
+        prepared = self._acquire()
+        prepared.seq = seq
+        prepared.capture_time = capture_time
+        with self._lock:
+            interpolation = self.interpolation
+        # dst= - no new arrays per frame
+        cv2.resize(frame, (width, height), dst=prepared.resized,    # dsize = (new_width, new_height)
+                   interpolation=interpolation)
+        cv2.cvtColor(prepared.resized, cv2.COLOR_BGR2RGB, dst=prepared.display)
+        prepared.original_shape = frame.shape
+        prepared.original = frame
+        self.crop_track_window(prepared)
+        prepared.prepared_time = time.perf_counter()
+        return prepared
+
+    def track_window_box(self, original_shape):
+        # the region shown in the track window, in original frame coordinates - x0, y0, x1, y1
+        track_x, track_y, track_size = self.get_track_window()
+        if not (track_x and track_y and track_size):
+            return None
+        height, width = self.display_shape
+        size_x = track_size * original_shape[1] / width
+        size_y = track_size * original_shape[0] / height
+        return (int(max(0, track_x - size_x / 4)), int(max(0, track_y - size_y / 4)),
+                int(min(original_shape[1], track_x + 3 / 4 * size_x)),
+                int(min(original_shape[0], track_y + 3 / 4 * size_y)))
+
+    def crop_track_window(self, prepared):
+        # cut from the camera frame when there is one, so the track window shows the camera's
+        # resolution - only this region is converted to RGB. the capture process copies just the
+        # region, it's used while the track window is still the same. without both it's cut from
+        # the resized frame
+        track_x, track_y, track_size = self.get_track_window()
+        prepared.track = None
+        prepared.track_size = track_size
+        if not (track_x and track_y and track_size):
+            return
+
+        box = self.track_window_box(prepared.original_shape)
+        region = prepared.track_region if prepared.track_region_box == box else None
+        if prepared.original is not None or region is not None:
+            if prepared.original is not None:
+                x_start, y_start, x_end, y_end = box
+                crop = prepared.original[y_start:y_end, x_start:x_end]
+            else:
+                crop = region
+            # the same part of the picture as in the resized frame, in camera pixels
+            size = int(track_size * prepared.original_shape[1] / self.display_shape[1])
+        else:
+            height, width = self.display_shape
+            x = track_x * width / prepared.original_shape[1]
+            y = track_y * height / prepared.original_shape[0]
+            x_start = int(max(0, int(x - track_size / 4)))
+            x_end = int(min(width, int(x + 3 / 4 * track_size)))
+            y_start = int(max(0, int(y - track_size / 4)))
+            y_end = int(min(height, int(y + 3 / 4 * track_size)))
+            crop = prepared.resized[y_start:y_end, x_start:x_end]
+            size = track_size
+        if crop.size == 0:
+            return
+        shape = crop.shape
+        if size > self.max_track_size:
+            scale = self.max_track_size / size
+            size = self.max_track_size
+            shape = (max(1, int(shape[0] * scale)), max(1, int(shape[1] * scale)), 3)
+        prepared.track_size = size
+        # QImage needs contiguous rows, converted into the slot's own track buffer
+        if prepared.track_buffer is None or prepared.track_buffer.shape != shape:
+            prepared.track_buffer = np.empty(shape, dtype=np.uint8)
+        if shape != crop.shape:
+            cv2.resize(crop, (shape[1], shape[0]), dst=prepared.track_buffer, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(prepared.track_buffer, cv2.COLOR_BGR2RGB, dst=prepared.track_buffer)
+        else:
+            cv2.cvtColor(crop, cv2.COLOR_BGR2RGB, dst=prepared.track_buffer)
+        prepared.track = prepared.track_buffer
+
+
+class AdaptiveQuality:
+    # steps the display quality down when the machine can't keep up and back up when it can.
+    # the load is the time a displayed frame costs within a display interval: preparing it on the
+    # capture thread, and on the GUI thread painting it plus how late the render timer fired (time
+    # other work on the GUI thread took). levels from the best one:
+    #   interpolation of the camera frame resize, paint every n-th render tick
+    # (a smaller painted frame doesn't help - scaling it up on the GUI thread costs more than
+    # painting the full one)
+    # only the video paint is reduced - the render timer keeps its rate, so the track window and
+    # the overlays follow at the full rate, and the pointer (its own widget) isn't touched at all.
+    # down after `down_after` seconds above `high`, up after `up_after` seconds below `low`;
+    # when a level up has to be undone soon after, the next try up waits twice as long
+    LEVELS = (
+        (cv2.INTER_LINEAR, 1),
+        (cv2.INTER_NEAREST, 1),
+        (cv2.INTER_NEAREST, 2),
+        (cv2.INTER_NEAREST, 3),
+    )
+    NAMES = ("full", "fast resize", "half rate", "third rate")
+
+    def __init__(self, high=0.6, low=0.3, down_after=0.5, up_after=3.0, max_up_after=30.0, smoothing=0.1):
+        self.high = high
+        self.low = low
+        self.down_after = down_after
+        self.base_up_after = up_after
+        self.up_after = up_after
+        self.max_up_after = max_up_after
+        self.smoothing = smoothing
+        self.enabled = True
+        self.level = 0
+        self.changes = 0
+        self.prepare_time = 0.0     # smoothed, seconds
+        self.paint_time = 0.0
+        self.late_time = 0.0
+        self._over_since = None
+        self._under_since = None
+        self._last_up = None
+        self._ticks = 0
+
+    def _smooth(self, old, new):
+        return old + (new - old) * self.smoothing
+
+    # record_* can be called from any thread, a float assignment is atomic
+    def record_prepare(self, seconds):
+        self.prepare_time = self._smooth(self.prepare_time, seconds)
+
+    def record_paint(self, seconds):
+        self.paint_time = self._smooth(self.paint_time, seconds)
+
+    def record_late(self, seconds):
+        self.late_time = self._smooth(self.late_time, max(0.0, seconds))
+
+    def get_load(self, interval) -> float:
+        return max(self.prepare_time, self.paint_time + self.late_time) / interval
+
+    def get_settings(self):
+        # interpolation, paint every n-th tick
+        return self.LEVELS[self.level]
+
+    def get_name(self):
+        return self.NAMES[self.level]
+
+    def paint_due(self) -> bool:
+        # called once per render tick
+        self._ticks += 1
+        if self._ticks >= self.LEVELS[self.level][1]:
+            self._ticks = 0
+            return True
+        return False
+
+    def update(self, now, interval) -> bool:
+        # interval - of the render timer. True when the level changed
+        if not self.enabled:
+            return self._set_level(0)
+        load = self.get_load(interval)
+        if load > self.high:
+            self._under_since = None
+            if self._over_since is None:
+                self._over_since = now
+            elif now - self._over_since >= self.down_after and self.level < len(self.LEVELS) - 1:
+                if self._last_up is not None and now - self._last_up < 2 * self.up_after:
+                    # the better level was too much after all
+                    self.up_after = min(self.max_up_after, self.up_after * 2)
+                return self._set_level(self.level + 1)
+        elif load < self.low:
+            self._over_since = None
+            if self._under_since is None:
+                self._under_since = now
+            elif now - self._under_since >= self.up_after and self.level > 0:
+                self._last_up = now
+                return self._set_level(self.level - 1)
+        else:
+            self._over_since = None
+            self._under_since = None
+        if self._last_up is not None and now - self._last_up > self.max_up_after:
+            # stable for a long time - the next level up can come sooner again
+            self.up_after = self.base_up_after
+            self._last_up = None
+        return False
+
+    def _set_level(self, level):
+        if level == self.level:
+            return False
+        self.level = level
+        self.changes += 1
+        self._over_since = None
+        self._under_since = None
+        self._ticks = 0
+        # the smoothed times were measured at the old level
+        self.prepare_time = self.paint_time = self.late_time = 0.0
+        return True
+
+    def reset(self):
+        # a new camera - starts from the full quality
+        self._set_level(0)
+        self.up_after = self.base_up_after
+        self._last_up = None
+
+
+def rgb_to_qimage(rgb):
+    # QImage directly over the numpy memory, no tobytes() copy.
+    # the QImage does not own the memory - rgb has to stay alive and unchanged while the image
+    # is used, so convert it to a QPixmap (which copies) before the buffer is released
+    h, w, ch = rgb.shape
+    return QImage(rgb.data, w, h, rgb.strides[0], QImage.Format_RGB888)